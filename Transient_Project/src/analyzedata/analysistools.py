@@ -13,22 +13,93 @@ import copy
 #it's there and emitting and unobscured but too noisy to detect
 #it's there and emitting and you see it
 
+def clippedNoise(frames, sigma=3, iterations=5, sample=None, rng=None):
+    """Return the sigma-clipped noise of every frame
+
+    The noise is the standard deviation of the pixels of a frame
+    after pixels more than sigma standard deviations from the mean
+    are stripped. Stripping is repeated (with the mean and std of the
+    remaining pixels) up to iterations times, or until no more pixels
+    are stripped. Every frame is clipped at once, with a mask.
+
+    Args:
+        frames:
+            2D image, or array of images whose last two axes are the
+                image axes (e.g. frames x rows x columns)
+        sigma:
+            Pixels further than sigma*std from the mean are stripped
+        iterations:
+            Maximum number of clipping passes
+        sample:
+            If given and smaller than the number of pixels in a frame,
+                the noise is estimated from this many randomly chosen
+                pixels (the same pixels in every frame)
+        rng:
+            np.random.Generator or seed used to choose the sample
+    Returns:
+        Array of the noise of every frame, of shape frames.shape[:-2]
+            (a 0-d array for a single image)
+    """
+    frames = np.asarray(frames)
+    if not np.issubdtype(frames.dtype, np.floating):
+        frames = frames.astype(float)
+    pixels = frames.reshape(frames.shape[:-2] + (-1,))
+    if sample is not None and sample < pixels.shape[-1]:
+        rng = np.random.default_rng(rng)
+        pixels = pixels[..., rng.choice(pixels.shape[-1], sample,
+                                        replace=False)]
+
+    keep = np.ones(pixels.shape, dtype=bool)
+    std = np.std(pixels, axis=-1, keepdims=True)
+    for _ in range(iterations):
+        mean = np.mean(pixels, axis=-1, keepdims=True, where=keep)
+        newKeep = keep & (np.abs(pixels - mean) <= sigma*std)
+        if np.array_equal(newKeep, keep):
+            break
+        keep = newKeep
+        std = np.std(pixels, axis=-1, keepdims=True, where=keep)
+    return std[..., 0]
+
+def calcSNRs(frames, locs, sigma=3, iterations=5, sample=None, rng=None):
+    """Return the SNR at every location of every frame
+
+    The noise of each frame is its clippedNoise
+
+    Args:
+        frames:
+            2D image, or frames x rows x columns array of images
+        locs:
+            k x 2 integer array of (row, column) locations looked at
+                in every frame, or frames x k x 2 array of different
+                locations for every frame
+        sigma, iterations, sample, rng:
+            See clippedNoise
+    Returns:
+        Array of k SNRs for a single image, or a frames x k array
+    """
+    frames = np.asarray(frames)
+    locs = np.asarray(locs, dtype=np.int64)
+    noise = clippedNoise(frames, sigma, iterations, sample, rng)
+    if frames.ndim == 2:
+        return frames[locs[..., 0], locs[..., 1]]/noise
+    if locs.ndim == 2:
+        values = frames[:, locs[:, 0], locs[:, 1]]
+    else:
+        which = np.arange(len(frames))[:, None]
+        values = frames[which, locs[..., 0], locs[..., 1]]
+    return values/noise[:, None]
+
 def calcSNR(inputArray, loc):
     """Calc SNR of the loc
     
     The noise is defined to be the standard deviation
     of all points in the array. Here, we strip data
-    with value > 3 sigma, then use the std dev of the
-    remaining data to set our value for the noise
+    more than 3 sigma from the mean, then use the std dev
+    of the remaining data to set our value for the noise
+    (a single pass of clippedNoise)
     """
-    dfc = copy.deepcopy(inputArray.flatten())
-    std = np.std(inputArray)
-    rude = np.mean(inputArray)
-    for i in (range(len(dfc))[::-1]):
-        if np.abs(dfc[i]) > (3*std + np.abs(rude)):
-            del dfc[i]
-    fixedStd = np.std(dfc)
-    return inputArray[loc]/fixedStd
+    inputArray = np.asarray(inputArray)
+    return inputArray[loc]/clippedNoise(inputArray, iterations=1)
 
 def addGaussianNoise(inputArray, mean, std):
     """Add noise to 2D input array
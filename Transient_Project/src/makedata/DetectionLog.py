@@ -0,0 +1,246 @@
+"""
+Columnar record of the detections made in a survey
+
+Every frame detection is stored as (eventId, index, noise): the
+position of the event in TransientSurvey.events, the index in the
+event's history at which it was detected, and the detector noise.
+Detections are recorded in bulk, one array per frame, into columns
+that grow by doubling.
+
+Every event's detections are also chained together in recording order
+(head, tail and nextRow), and the chains are extended as detections
+are recorded. Looking up one event's detections therefore only costs
+the number of detections it has, however large the log grows.
+
+Clearing an event only unlinks its chain and marks its rows dead
+(eventId -1). Dead rows are dropped the next time the whole log is
+read or has to grow, so clearing costs the number of detections of
+the event, not the size of the log.
+
+The holistic detection flag of every event is kept here as well, so
+that all of the detection state of a survey lives in one place.
+"""
+
+import numpy as np
+import copy
+
+class DetectionLog:
+    def __init__(self, capacity=1024):
+        self.capacity = max(1, int(capacity))
+        self.clear()
+
+    def clear(self):
+        """Forget every detection and holistic detection"""
+        self.size = 0
+        self.eventIds = np.zeros(self.capacity, dtype=np.int64)
+        self.indices = np.zeros(self.capacity, dtype=np.int64)
+        self.noise = np.zeros(self.capacity)
+
+        #Number of rows of cleared events not yet compacted away
+        self.dead = 0
+
+        #Row of the next detection of the same event, -1 for the last
+        self.nextRow = np.zeros(self.capacity, dtype=np.int64)
+
+        #First and last row of every event's detections, -1 for none
+        self.head = np.zeros(0, dtype=np.int64)
+        self.tail = np.zeros(0, dtype=np.int64)
+
+        self.pending = ([], [], [])
+
+        #True while the arrays are shared with a copy of the log
+        self.shared = False
+        self.clearHolistic()
+
+    def copy(self):
+        """Return an independent copy of the log
+
+        The arrays are shared until either log records something
+        (copy-on-write)
+        """
+        self._flush()
+        clone = copy.copy(self)
+        clone.pending = ([], [], [])
+        clone.holistic = self.holistic.copy()
+        self.shared = True
+        clone.shared = True
+        return clone
+
+    def _own(self):
+        """Take a private copy of the arrays if they are shared"""
+        if not self.shared:
+            return
+        for name in ("eventIds", "indices", "noise", "nextRow", "head",
+                     "tail"):
+            setattr(self, name, getattr(self, name).copy())
+        self.shared = False
+
+    def clearHolistic(self):
+        """Forget every holistic detection, keeping frame detections"""
+        self.holistic = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return self.size - self.dead + len(self.pending[0])
+
+    def _grow(self, needed):
+        """Make room for at least needed more detections"""
+        if self.size + needed <= self.capacity:
+            return
+        self._compact()
+        needed += self.size
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2*self.capacity)
+        for name in ("eventIds", "indices", "noise", "nextRow"):
+            old = getattr(self, name)
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[:self.size] = old[:self.size]
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def _growEvents(self, numEvents):
+        """Make room in head and tail for events up to numEvents - 1"""
+        if numEvents <= len(self.head):
+            return
+        old = len(self.head)
+        size = max(numEvents, 2*old)
+        for name in ("head", "tail"):
+            grown = np.full(size, -1, dtype=np.int64)
+            grown[:old] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def _compact(self):
+        """Drop the dead rows, renumbering the chains"""
+        if self.dead == 0:
+            return
+        self._own()
+        size = self.size
+        keep = self.eventIds[:size] >= 0
+        #New row of every kept row. Live chains never pass through
+        #   dead rows, so every link of a kept row is kept too
+        newRow = np.cumsum(keep) - 1
+        nextRow = self.nextRow[:size][keep]
+        nextRow[nextRow >= 0] = newRow[nextRow[nextRow >= 0]]
+        for name in ("eventIds", "indices", "noise"):
+            column = getattr(self, name)
+            kept = column[:size][keep]
+            column[:len(kept)] = kept
+        self.nextRow[:len(nextRow)] = nextRow
+        for ends in (self.head, self.tail):
+            linked = ends >= 0
+            ends[linked] = newRow[ends[linked]]
+        self.size = len(nextRow)
+        self.dead = 0
+
+    def record(self, eventIds, indices, noise):
+        """Record many detections at once
+
+        Args:
+            eventIds:
+                Integer array-like. Ids of the detected events
+            indices:
+                Integer array-like. History index of each detection
+            noise:
+                Float array-like. Detector noise of each detection
+        """
+        if len(eventIds) == 0:
+            return
+        self._flush()
+        self._own()
+        eventIds = np.asarray(eventIds, dtype=np.int64)
+        n = len(eventIds)
+        self._grow(n)
+        rows = np.arange(self.size, self.size + n)
+        self.eventIds[rows] = eventIds
+        self.indices[rows] = indices
+        self.noise[rows] = noise
+        self.nextRow[rows] = -1
+        self.size += n
+
+        #Chain the new rows of every event in recording order...
+        order = np.argsort(eventIds, kind="stable")
+        sortedIds = eventIds[order]
+        sortedRows = rows[order]
+        same = sortedIds[1:] == sortedIds[:-1]
+        self.nextRow[sortedRows[:-1][same]] = sortedRows[1:][same]
+
+        #...and hang each event's new chain off the end of its old one
+        first = np.concatenate([[True], ~same])
+        last = np.concatenate([~same, [True]])
+        events = sortedIds[first]
+        self._growEvents(events[-1] + 1)
+        oldTails = self.tail[events]
+        extends = oldTails >= 0
+        self.nextRow[oldTails[extends]] = sortedRows[first][extends]
+        self.head[events[~extends]] = sortedRows[first][~extends]
+        self.tail[events] = sortedRows[last]
+
+    def recordOne(self, eventId, index, noise):
+        """Record a single detection"""
+        self.pending[0].append(eventId)
+        self.pending[1].append(index)
+        self.pending[2].append(noise)
+
+    def _flush(self):
+        """Record the single detections as one batch"""
+        if self.pending[0]:
+            pending = self.pending
+            self.pending = ([], [], [])
+            self.record(*pending)
+
+    def columns(self):
+        """Return (eventIds, indices, noise) arrays of all detections"""
+        self._flush()
+        self._compact()
+        return (self.eventIds[:self.size], self.indices[:self.size],
+                self.noise[:self.size])
+
+    def forEvent(self, eventId):
+        """Return (indices, noise) arrays of one event's detections"""
+        self._flush()
+        rows = []
+        if eventId < len(self.head):
+            row = self.head[eventId]
+            while row >= 0:
+                rows.append(row)
+                row = self.nextRow[row]
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.indices[rows], self.noise[rows]
+
+    def counts(self, numEvents):
+        """Return the number of detections of every event"""
+        eventIds = self.columns()[0]
+        return np.bincount(eventIds, minlength=numEvents)[:numEvents]
+
+    def clearEvent(self, eventId):
+        """Forget the detections of a single event
+
+        Its rows are marked dead and compacted away later
+        """
+        self._flush()
+        self.setHolistic(eventId, False)
+        if eventId >= len(self.head) or self.head[eventId] < 0:
+            return
+        self._own()
+        row = self.head[eventId]
+        while row >= 0:
+            self.eventIds[row] = -1
+            self.dead += 1
+            row = self.nextRow[row]
+        self.head[eventId] = -1
+        self.tail[eventId] = -1
+
+    def isHolistic(self, eventId):
+        if eventId >= len(self.holistic):
+            return False
+        return bool(self.holistic[eventId])
+
+    def setHolistic(self, eventId, value):
+        if eventId >= len(self.holistic):
+            if not value:
+                return
+            grown = np.zeros(max(eventId + 1, 2*len(self.holistic)),
+                             dtype=bool)
+            grown[:len(self.holistic)] = self.holistic
+            self.holistic = grown
+        self.holistic[eventId] = value
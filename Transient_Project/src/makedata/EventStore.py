@@ -0,0 +1,397 @@
+"""
+Columnar (struct-of-arrays) storage for TransientEvent objects
+
+The EventStore keeps the state of every event that moves in a straight
+line (i.e. has neither a velocityFunction nor a movementFunction) in
+flat numpy arrays. This lets TransientSurvey advance the whole
+population in a handful of array operations instead of calling
+TransientEvent.advanceEvent one object at a time.
+
+Events that are attached to a store keep working as ordinary
+TransientEvent objects: their time, position, velocity, luminosity,
+history and markedForDeath attributes are read out of the store.
+
+Events spawned in bulk from a SpawnBatch are written straight into the
+columns. They get a TransientEvent object only when one is asked for
+(see EventStore.event).
+"""
+
+import numpy as np
+import copy
+from .TransientEvent import (TransientEvent, zeroFunction, HISTORY_WIDTH,
+                             INITIAL_HISTORY_ROWS)
+
+#Columns of the store and their dtypes
+STORE_COLUMNS = {"time": np.int64,
+                 "birth": np.int64,
+                 "x": np.float64,
+                 "y": np.float64,
+                 "xdot": np.float64,
+                 "ydot": np.float64,
+                 "lum": np.float64,
+                 "lifetime": np.int64,
+                 "classID": object,
+                 "alive": bool,
+                 "noisy": bool,
+                 "lumStart": np.int64,
+                 "lumLen": np.int64,
+                 "histStart": np.int64,
+                 "histRows": np.int64,
+                 "eventIndex": np.int64,
+                 "batch": np.int64}
+
+class EventStore:
+    """
+    Args:
+        capacity:
+            Number of events to allocate room for up front.
+            The store grows by doubling when it runs out.
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.capacity = max(1, int(capacity))
+        for name, dtype in STORE_COLUMNS.items():
+            setattr(self, name, np.zeros(self.capacity, dtype=dtype))
+
+        #slot -> TransientEvent, or None for spawned events that have
+        #   not been asked for yet
+        self.events = []
+
+        #(SpawnBatch, first slot) of the batches the store was filled
+        #   from, addressed by batch. batch is -1 for events added
+        #   one at a time
+        self.batches = []
+
+        #Indices of the events that are still alive. Events in slots
+        #   from pendingFrom on are added to live at the next advance,
+        #   to avoid an np.append per event
+        self.live = np.zeros(0, dtype=np.int64)
+        self.pendingFrom = 0
+
+        #Pool of all luminosity series, addressed by lumStart/lumLen
+        self.lumPool = np.zeros(self.capacity)
+        self.lumRows = 0
+
+        #Pool of all event histories, addressed by histStart.
+        #Each event reserves up to INITIAL_HISTORY_ROWS rows (histRows)
+        #   at birth. An event that fills them moves its history to
+        #   twice as many rows at the end of the pool
+        self.traj = np.zeros((self.capacity, HISTORY_WIDTH))
+        self.trajRows = 0
+
+        #True while the arrays are shared with a fork of the store
+        self.shared = False
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def accepts(event):
+        """Return True if the event can be advanced by the store
+
+        Events with custom motion or non-numeric luminosity series
+        have to be advanced by TransientEvent.advanceEvent
+        """
+        if (event.velocityFunction is not None
+                or event.movementFunction is not None):
+            return False
+        try:
+            series = np.asarray(event.luminositySeries, dtype=np.float64)
+        except (TypeError, ValueError):
+            return False
+        return series.ndim == 1 and len(series) > 0
+
+    def fork(self):
+        """Return a store that shares this store's arrays
+
+        Neither store copies anything until it is changed, at which
+        point it takes a private copy of the arrays (copy-on-write).
+        """
+        clone = copy.copy(self)
+        self.shared = True
+        clone.shared = True
+        return clone
+
+    def _own(self):
+        """Take a private copy of the arrays if they are shared"""
+        if not self.shared:
+            return
+        for name in STORE_COLUMNS:
+            setattr(self, name, getattr(self, name).copy())
+        self.lumPool = self.lumPool.copy()
+        self.traj = self.traj.copy()
+        self.live = self.live.copy()
+        self.events = list(self.events)
+        self.batches = list(self.batches)
+        self.shared = False
+
+    def _grow(self, needed):
+        """Make room for at least needed events"""
+        if needed <= self.capacity:
+            return
+        newCapacity = max(needed, 2*self.capacity)
+        for name in STORE_COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(newCapacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.capacity = newCapacity
+
+    def _reserve(self, pool, used, needed):
+        """Return pool, grown by doubling so that it holds needed rows"""
+        if needed <= len(pool):
+            return pool
+        new = np.zeros((max(needed, 2*len(pool)),) + pool.shape[1:])
+        new[:used] = pool[:used]
+        return new
+
+    def add(self, event, eventIndex=-1):
+        """Copy an event into the store and attach it
+
+        Args:
+            event:
+                TransientEvent. Must satisfy EventStore.accepts
+            eventIndex:
+                Position of the event in TransientSurvey.events
+        Returns:
+            The slot of the event in the store
+        """
+        self._own()
+        slot = self.size
+        self._grow(slot + 1)
+        self.size += 1
+
+        series = np.asarray(event.luminositySeries, dtype=np.float64)
+        self.lumPool = self._reserve(self.lumPool, self.lumRows,
+                                     self.lumRows + len(series))
+        self.lumPool[self.lumRows:self.lumRows + len(series)] = series
+        self.lumStart[slot] = self.lumRows
+        self.lumLen[slot] = len(series)
+        self.lumRows += len(series)
+
+        rows = max(min(event.lifetime, INITIAL_HISTORY_ROWS), 1)
+        self.traj = self._reserve(self.traj, self.trajRows,
+                                  self.trajRows + rows)
+        self.traj[self.trajRows] = event.history[0]
+        self.histStart[slot] = self.trajRows
+        self.histRows[slot] = rows
+        self.trajRows += rows
+
+        self.time[slot] = event.time
+        self.birth[slot] = event.time
+        self.x[slot] = event.x
+        self.y[slot] = event.y
+        self.xdot[slot] = event.xdot
+        self.ydot[slot] = event.ydot
+        self.lum[slot] = event.lum
+        self.lifetime[slot] = event.lifetime
+        self.classID[slot] = event.classID
+        self.alive[slot] = not event.markedForDeath
+        self.noisy[slot] = event.noiseFunc is not zeroFunction
+        self.eventIndex[slot] = eventIndex
+        self.batch[slot] = -1
+
+        self.events.append(event)
+        event.attach(self, slot)
+        return slot
+
+    def addBatch(self, batch, firstIndex=-1, rng=None):
+        """Write every event of a SpawnBatch into the store
+
+        No TransientEvent objects are made. Only the birth luminosity
+        noise, if the batch has a noise function, is computed one
+        event at a time.
+
+        Args:
+            batch:
+                SpawnBatch
+            firstIndex:
+                Position of the batch's first event in
+                    TransientSurvey.events. The others follow it
+            rng:
+                Stream for noise functions marked with takesRNG
+        Returns:
+            Integer array. The slots of the events in the store
+        """
+        self._own()
+        n = len(batch)
+        slots = np.arange(self.size, self.size + n)
+        self._grow(self.size + n)
+        self.size += n
+
+        #Every template goes into the pool once, however many
+        #   events use it
+        starts = np.zeros(len(batch.series), dtype=np.int64)
+        lengths = np.zeros(len(batch.series), dtype=np.int64)
+        for k, series in enumerate(batch.series):
+            self.lumPool = self._reserve(self.lumPool, self.lumRows,
+                                         self.lumRows + len(series))
+            self.lumPool[self.lumRows:self.lumRows + len(series)] = series
+            starts[k] = self.lumRows
+            lengths[k] = len(series)
+            self.lumRows += len(series)
+        self.lumStart[slots] = starts[batch.templates]
+        self.lumLen[slots] = lengths[batch.templates]
+
+        lifetime = batch.lifetimes
+        rows = np.clip(lifetime, 1, INITIAL_HISTORY_ROWS)
+        self.histStart[slots] = self.trajRows + np.cumsum(rows) - rows
+        self.histRows[slots] = rows
+        self.traj = self._reserve(self.traj, self.trajRows,
+                                  self.trajRows + int(rows.sum()))
+        self.trajRows += int(rows.sum())
+
+        locs = batch.birthLocs
+        self.time[slots] = locs[:, 0]
+        self.birth[slots] = locs[:, 0]
+        self.x[slots] = locs[:, 1]
+        self.y[slots] = locs[:, 2]
+        self.xdot[slots] = locs[:, 3]
+        self.ydot[slots] = locs[:, 4]
+        self.lifetime[slots] = lifetime
+        self.classID[slots] = batch.classIDs
+        self.alive[slots] = lifetime > 1
+        self.noisy[slots] = batch.noiseFunc is not zeroFunction
+        self.eventIndex[slots] = firstIndex + np.arange(n)
+        self.batch[slots] = len(self.batches)
+
+        lum = self.lumPool[self.lumStart[slots]]
+        if batch.noiseFunc is not zeroFunction:
+            for i in range(n):
+                lum[i] += batch.noise(lum[i], locs[i].tolist(),
+                                      int(lifetime[i]), rng)
+        self.lum[slots] = lum
+
+        start = self.histStart[slots]
+        self.traj[start, 0] = self.time[slots]
+        self.traj[start, 1:5] = locs[:, 1:5]
+        self.traj[start, 5] = lum
+
+        self.batches.append((batch, self.size - n))
+        self.events.extend([None]*n)
+        return slots
+
+    def event(self, slot):
+        """Return the TransientEvent of a slot, making it if needed
+
+        Events made here are attached to the store, but are not
+        registered with a survey.
+        """
+        event = self.events[slot]
+        if event is None:
+            batch, firstSlot = self.batches[self.batch[slot]]
+            event = TransientEvent.stored(
+                            self, slot,
+                            batch.series[batch.templates[slot - firstSlot]],
+                            batch.noiseFunc, batch.nArgs)
+            self.events[slot] = event
+        return event
+
+    def _moveHistories(self, slots, rows):
+        """Give the history of every slot in slots more room
+
+        Args:
+            slots:
+                Integer array. Slots whose reserved rows are all used
+            rows:
+                Integer array. New number of rows of every slot. The
+                    new rows go at the end of the pool, and the old
+                    ones are left unused
+        """
+        used = self.histRows[slots]
+        starts = self.trajRows + np.cumsum(rows) - rows
+        self.traj = self._reserve(self.traj, self.trajRows,
+                                  self.trajRows + int(rows.sum()))
+        self.trajRows += int(rows.sum())
+        #Every old row and the row it moves to, segment by segment
+        offsets = np.arange(int(used.sum())) - np.repeat(np.cumsum(used)
+                                                         - used, used)
+        self.traj[np.repeat(starts, used) + offsets] = \
+            self.traj[np.repeat(self.histStart[slots], used) + offsets]
+        self.histStart[slots] = starts
+        self.histRows[slots] = rows
+
+    def history(self, slot):
+        """Return a view of the history rows recorded for slot"""
+        start = self.histStart[slot]
+        return self.traj[start : start + self.time[slot]
+                                        - self.birth[slot] + 1]
+
+    def liveSlots(self):
+        """Return the slots of all living events"""
+        if self.pendingFrom < self.size:
+            born = np.flatnonzero(self.alive[self.pendingFrom:self.size])
+            self.live = np.concatenate((self.live, born + self.pendingFrom))
+            self.pendingFrom = self.size
+        return self.live
+
+    def advance(self, rng=None, dead=None):
+        """Advance every living event in the store by one tick
+
+        Args:
+            rng:
+                Stream for noise functions marked with takesRNG
+            dead:
+                Integer array of the living slots that die during this
+                    tick, e.g. from an ExpirationWheel. Found from the
+                    lifetimes if not given
+
+        Returns:
+            slots, indices, dead:
+                Integer arrays. The events that are still alive after
+                this tick, the index in their history that
+                corresponds to this tick, and the events that died
+                during this tick
+        """
+        self._own()
+        live = self.liveSlots()
+
+        self.time[live] += 1
+        age = self.time[live] - self.birth[live]
+        x = self.x[live] + self.xdot[live]
+        y = self.y[live] + self.ydot[live]
+        self.x[live] = x
+        self.y[live] = y
+
+        lum = self.lumPool[self.lumStart[live] + age % self.lumLen[live]]
+
+        #Luminosity noise is an arbitrary callable, so events with
+        #   a noise function are the only ones touched one at a time
+        noisy = np.flatnonzero(self.noisy[live])
+        for i in noisy:
+            slot = live[i]
+            event = self.events[slot]
+            loc = [int(self.time[slot]), x[i], y[i],
+                   self.xdot[slot], self.ydot[slot]]
+            if event is None:
+                batch = self.batches[self.batch[slot]][0]
+                lum[i] += batch.noise(lum[i], loc, int(self.lifetime[slot]),
+                                      rng)
+            else:
+                lum[i] += event.noise(lum[i], loc, rng)
+        self.lum[live] = lum
+
+        full = age >= self.histRows[live]
+        if full.any():
+            grown = live[full]
+            self._moveHistories(grown, np.maximum(
+                np.minimum(2*self.histRows[grown], self.lifetime[grown]),
+                age[full] + 1))
+
+        rows = self.histStart[live] + age
+        self.traj[rows, 0] = self.time[live]
+        self.traj[rows, 1] = x
+        self.traj[rows, 2] = y
+        self.traj[rows, 3] = self.xdot[live]
+        self.traj[rows, 4] = self.ydot[live]
+        self.traj[rows, 5] = lum
+
+        if dead is None:
+            #The +1 here accounts for age being 1 fewer
+            #than the number of frames the event has been alive
+            dead = live[age + 1 >= self.lifetime[live]]
+        self.alive[dead] = False
+        surviving = self.alive[live]
+        self.live = live[surviving]
+        return self.live, age[surviving], dead
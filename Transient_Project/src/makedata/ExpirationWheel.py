@@ -0,0 +1,81 @@
+"""
+Schedule of the frames in which the events of a survey die
+
+An event's lifetime is known when it is born, so its death can be
+scheduled right away. Scheduled deaths are kept in buckets keyed by
+the frame of death, so finding the events that die in a frame costs
+only the number of events that die in it.
+"""
+
+import numpy as np
+import copy
+
+class ExpirationWheel:
+    def __init__(self):
+        #frame -> list of integer arrays of the ids dying in that frame
+        self.buckets = {}
+        self.size = 0
+
+        #True while the buckets are shared with a fork of the wheel
+        self.shared = False
+
+    def __len__(self):
+        return self.size
+
+    def fork(self):
+        """Return a wheel that shares this wheel's buckets
+
+        Whichever wheel is changed first takes a private copy of the
+        buckets (copy-on-write). The id arrays themselves are never
+        changed, so they stay shared.
+        """
+        clone = copy.copy(self)
+        self.shared = True
+        clone.shared = True
+        return clone
+
+    def _own(self):
+        if self.shared:
+            self.buckets = {frame: list(chunks)
+                            for frame, chunks in self.buckets.items()}
+            self.shared = False
+
+    def schedule(self, ids, frames):
+        """Schedule the deaths of many events
+
+        Args:
+            ids:
+                Integer array-like. Ids of the events
+            frames:
+                Integer array-like. The frame in which each event dies
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        frames = np.asarray(frames, dtype=np.int64)
+        if len(ids) != len(frames):
+            raise ValueError("ids and frames have different lengths")
+        if len(ids) == 0:
+            return
+        self._own()
+        self.size += len(ids)
+
+        #Group the ids by frame, keeping their order within a frame
+        order = np.argsort(frames, kind="stable")
+        frames = frames[order]
+        starts = np.flatnonzero(np.diff(frames)) + 1
+        for frame, chunk in zip(frames[np.r_[0, starts]].tolist(),
+                                np.split(ids[order], starts)):
+            self.buckets.setdefault(frame, []).append(chunk)
+
+    def expire(self, frame):
+        """Remove and return the ids of the events that die in frame
+
+        Returns:
+            Integer array, in the order the deaths were scheduled
+        """
+        if frame not in self.buckets:
+            return np.zeros(0, dtype=np.int64)
+        self._own()
+        chunks = self.buckets.pop(frame)
+        ids = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        self.size -= len(ids)
+        return ids
@@ -0,0 +1,94 @@
+"""
+Compressed (CSR-style) record of which events exist in each frame
+
+Frame i holds the events eventIds[offsets[i]:offsets[i+1]] and the
+indices into their history that correspond to frame i,
+indices[offsets[i]:offsets[i+1]]. The event ids are positions in
+TransientSurvey.events.
+
+Frames can only be appended. Reading a frame returns views into the
+underlying arrays, so no data is copied.
+"""
+
+import numpy as np
+import copy
+
+class FrameIndex:
+    """
+    Args:
+        capacity:
+            Number of (event, index) entries to allocate room for
+                up front. The arrays grow by doubling.
+    """
+
+    def __init__(self, capacity=1024):
+        self.offsets = np.zeros(64, dtype=np.int64)
+        self.eventIds = np.zeros(max(1, int(capacity)), dtype=np.int32)
+        self.indices = np.zeros(max(1, int(capacity)), dtype=np.int32)
+        self.numFrames = 0
+        self.size = 0
+
+        #True while the arrays are shared with a fork of the index
+        self.shared = False
+
+    def __len__(self):
+        return self.numFrames
+
+    def fork(self):
+        """Return an index that shares this index's arrays
+
+        Whichever index is appended to first takes a private copy
+        of the arrays (copy-on-write).
+        """
+        clone = copy.copy(self)
+        self.shared = True
+        clone.shared = True
+        return clone
+
+    def _grow(self, array, needed):
+        """Return array, grown by doubling so that it holds needed items"""
+        if needed <= len(array):
+            return array
+        new = np.zeros(max(needed, 2*len(array)), dtype=array.dtype)
+        new[:len(array)] = array
+        return new
+
+    def append(self, eventIds, indices):
+        """Add a frame to the end of the index
+
+        Args:
+            eventIds:
+                Integer array-like. Ids of the events in the frame
+            indices:
+                Integer array-like. The index in each event's history
+                    that corresponds to this frame
+        """
+        n = len(eventIds)
+        if len(indices) != n:
+            raise ValueError("eventIds and indices have different lengths")
+        if self.shared:
+            self.offsets = self.offsets.copy()
+            self.eventIds = self.eventIds.copy()
+            self.indices = self.indices.copy()
+            self.shared = False
+        self.offsets = self._grow(self.offsets, self.numFrames + 2)
+        self.eventIds = self._grow(self.eventIds, self.size + n)
+        self.indices = self._grow(self.indices, self.size + n)
+        self.eventIds[self.size:self.size + n] = eventIds
+        self.indices[self.size:self.size + n] = indices
+        self.size += n
+        self.numFrames += 1
+        self.offsets[self.numFrames] = self.size
+
+    def frame(self, i):
+        """Return (eventIds, indices) views of frame i"""
+        if i < 0:
+            i += self.numFrames
+        if i < 0 or i >= self.numFrames:
+            raise IndexError("frame index out of range")
+        start, stop = self.offsets[i], self.offsets[i+1]
+        return self.eventIds[start:stop], self.indices[start:stop]
+
+    def frameSize(self, i):
+        """Return the number of events in frame i"""
+        return int(self.offsets[i+1] - self.offsets[i])
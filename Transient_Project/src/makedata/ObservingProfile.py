@@ -18,6 +18,100 @@ OP_REQD_ARGS = {"viewingField" : 3,
                 "surveyNoiseFunction": 2,
                 "measurementFunction": 2}
 
+def batchDetection(func):
+    """Mark a viewingField, extraObstruction or surveyNoiseFunction
+    as supporting the batch detection protocol
+
+    Batch functions are handed a whole frame as a FrameBatch instead
+    of a list of (event, index) pairs or a single event:
+        viewingField(time, frameBatch, survey, *vArgs)
+        extraObstruction(time, frameBatch, survey, *oArgs)
+            Return a boolean mask, True for the events that pass
+        surveyNoiseFunction(frameBatch, survey, *sArgs)
+            Return the detector noise of every event in the batch
+    """
+    func.batch = True
+    return func
+
+def sameStage(old, new):
+    """Return True if two stage keys from stageKeys are the same"""
+    if old[0] is not new[0]:
+        return False
+    try:
+        return bool(old[1] == new[1])
+    except ValueError:
+        #Args holding numpy arrays
+        return (len(old[1]) == len(new[1])
+                and all(np.array_equal(a, b)
+                        for a, b in zip(old[1], new[1])))
+
+def isBatch(func):
+    """Return True if func follows the batch detection protocol"""
+    return getattr(func, "batch", False)
+
+class FrameBatch:
+    """The events of one frame, as arrays
+
+    Args:
+        time:
+            The frame the batch belongs to
+        eventIds:
+            Integer array. Positions of the events in survey.events
+        indices:
+            Integer array. Index in each event's history for this frame
+        survey:
+            The survey the events belong to
+        rows:
+            N x 6 float array. The history row of each event for this
+                frame, [time, x, y, xdot, ydot, lum]. Looked up from
+                the survey the first time it is needed if not given
+    """
+    def __init__(self, time, eventIds, indices, survey, rows=None):
+        self.time = time
+        self.eventIds = eventIds
+        self.indices = indices
+        self.survey = survey
+        self._rows = rows
+
+    def __len__(self):
+        return len(self.eventIds)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = self.survey.historyRows(self.eventIds, self.indices)
+        return self._rows
+
+    @property
+    def positions(self):
+        """N x 2 array of (x, y)"""
+        return self.rows[:, 1:3]
+
+    @property
+    def velocities(self):
+        """N x 2 array of (xdot, ydot)"""
+        return self.rows[:, 3:5]
+
+    @property
+    def lums(self):
+        return self.rows[:, 5]
+
+    @property
+    def events(self):
+        """List of the TransientEvent objects in the batch"""
+        events = self.survey.events
+        return [events[e] for e in self.eventIds.tolist()]
+
+    def pairs(self):
+        """Return the batch in the FrameEvents convention"""
+        return list(zip(self.events, self.indices.tolist()))
+
+    def subset(self, mask):
+        """Return a FrameBatch of the events where mask is True"""
+        rows = None if self._rows is None else self._rows[mask]
+        return FrameBatch(self.time, self.eventIds[mask], self.indices[mask],
+                          self.survey, rows)
+
 class ObservingProfile:
     def __init__(self, 
                  viewingField, viewingFieldArgs, vFieldCharPath,
@@ -55,6 +149,10 @@ class ObservingProfile:
                         survey: the survey object that holds the events
 
                         *extraArgs: extra arguments
+
+                    Functions decorated with batchDetection are instead
+                    given the whole frame as a FrameBatch and return
+                    a boolean mask (see batchDetection).
             extraObstruction:
                 Function. Return an array of events following the FrameEvents
                     convention. The extraObstruction should look at the events
@@ -73,6 +171,10 @@ class ObservingProfile:
 
                         survey: the relevant survey object itself
 
+                    May follow the batch protocol, like viewingField.
+                    Random obstruction should be drawn from
+                    survey.random.obstruction.
+
             holisticDetection:
                 Function. Look at an event's detectionHistory and return true 
                     if the input event is a confirmed detection. 
@@ -94,6 +196,10 @@ class ObservingProfile:
                             the event to have noise generated on
                         survey: the relevant survey object itself
                     returns noise to be added to lum
+                    Noise should be drawn from survey.random.detectorNoise.
+
+                    Batch functions are given a FrameBatch instead of
+                    an event and return one noise value per event.
             vFieldCharPath,eObstructCharPath,hDetectCharPath,sNoiseCharPath:
                 Characteristic values for search strategy optimization
                 Ranges of legal values for the associated extraArgs.
@@ -176,6 +282,92 @@ class ObservingProfile:
         
         self.measureFunc = measurementFunction
 
+    def _filterStage(self, func, args, time, batch, survey):
+        """Return the mask of events in batch that func lets through"""
+        if isBatch(func):
+            mask = np.asarray(func(time, batch, survey, *args), dtype=bool)
+            if mask.shape != (len(batch),):
+                raise ValueError("batch detection function returned a mask"
+                                 + " of shape " + str(mask.shape)
+                                 + " for " + str(len(batch)) + " events")
+            return mask
+
+        #Per-pair functions return the pairs that pass
+        events = batch.events
+        passed = func(time, list(zip(events, batch.indices.tolist())),
+                      survey, *args)
+        position = {id(event): k for k, event in enumerate(events)}
+        mask = np.zeros(len(batch), dtype=bool)
+        for pair in passed:
+            mask[position[id(pair[0])]] = True
+        return mask
+
+    def _noiseStage(self, batch, survey):
+        """Return the detector noise of every event in batch"""
+        if isBatch(self.surveyNoise):
+            noise = self.surveyNoise(batch, survey, *self.sArgs)
+            return np.broadcast_to(np.asarray(noise, dtype=np.float64),
+                                   (len(batch),))
+        return np.array([self.surveyNoise(event, survey, *self.sArgs)
+                         for event in batch.events], dtype=np.float64)
+
+    def stageKeys(self):
+        """Return what each frame detection stage's result depends on
+
+        One (function, extraArgs) pair per stage, in the order
+        viewingField, extraObstruction, surveyNoiseFunction. The args
+        are copied, so later changes to the profile can be spotted by
+        comparing against the returned keys with sameStage.
+        """
+        return [(self.view, copy.deepcopy(self.vArgs)),
+                (self.obstruct, copy.deepcopy(self.oArgs)),
+                (self.surveyNoise, copy.deepcopy(self.sArgs))]
+
+    def frameDetectArrays(self, time, eventIds, indices, survey,
+                          stages=None):
+        """Mark events that are viewed and unobstructed
+
+        Same as frameDetect, but the frame is given in the array form
+        kept by TransientSurvey.frames, and the result of every stage
+        is returned so that it can be reused.
+
+        Args:
+            time:
+                the frame to detect
+            eventIds, indices:
+                Integer arrays. The frame's events and history indices
+            survey:
+                the survey the events belong to
+            stages:
+                Optional list of [viewMask, obstructMask, noise] from an
+                    earlier call on the same frame. Entries that are not
+                    None are reused instead of calling the stage's
+                    function.
+        Returns:
+            [viewMask, obstructMask, noise]:
+                viewMask is over the frame, obstructMask is over the
+                events that passed the view, and noise is over the
+                events that passed both
+        """
+        if stages is None:
+            stages = [None, None, None]
+        else:
+            stages = list(stages)
+
+        batch = FrameBatch(time, eventIds, indices, survey)
+        if stages[0] is None:
+            stages[0] = self._filterStage(self.view, self.vArgs,
+                                          time, batch, survey)
+        batch = batch.subset(stages[0])
+        if stages[1] is None:
+            stages[1] = self._filterStage(self.obstruct, self.oArgs,
+                                          time, batch, survey)
+        batch = batch.subset(stages[1])
+        if stages[2] is None:
+            stages[2] = self._noiseStage(batch, survey)
+        survey.detections.record(batch.eventIds, batch.indices, stages[2])
+        return stages
+
     def frameDetect(self, time, frameEvents, survey):
         """Mark events that are viewed and unobstructed
         """
@@ -0,0 +1,76 @@
+"""
+Seedable random number streams owned by a survey
+
+Every survey owns a RandomStreams object (survey.random) with one
+independent numpy Generator per source of randomness:
+    generation:     generator functions making new events
+    eventNoise:     noise on the luminosity of the events
+    detectorNoise:  surveyNoiseFunction
+    obstruction:    viewingField and extraObstruction
+    ids:            the eventID of events added to the survey
+
+Plugins are handed the survey, so they draw from these instead of the
+global np.random. Since the streams are independent, reseeding them
+lets two runs of a survey share random numbers (common random numbers)
+stream by stream: e.g. the same events with different detector noise.
+"""
+
+import numpy as np
+
+STREAMS = ("generation", "eventNoise", "detectorNoise", "obstruction", "ids")
+
+def takesRNG(func):
+    """Mark an event noiseFunction as taking an rng keyword argument
+
+    Marked noise functions are called as
+        noiseFunction(lum, loc, lifetime, *noiseExtraArgs, rng=rng)
+    where rng is the eventNoise stream of the event's survey
+    """
+    func.takesRNG = True
+    return func
+
+class RandomStreams:
+    """
+    Args:
+        seed:
+            Anything np.random.SeedSequence accepts. None draws fresh
+                entropy from the OS
+    """
+    def __init__(self, seed=None):
+        self.reseed(seed)
+
+    def reseed(self, seed=None, streams=STREAMS):
+        """Restart streams from a new seed
+
+        The same seed always gives the same numbers on a stream,
+        whichever other streams are reseeded with it.
+
+        Args:
+            seed:
+                Anything np.random.SeedSequence accepts
+            streams:
+                Names of the streams to restart. Defaults to all of them
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            entropy, spawnKey = seed.entropy, seed.spawn_key
+        else:
+            entropy, spawnKey = seed, ()
+        self.seed = np.random.SeedSequence(entropy, spawn_key=spawnKey)
+
+        #Children are built by hand rather than with spawn, which
+        #   would give different children on every call
+        for i, name in enumerate(STREAMS):
+            if name in streams:
+                child = np.random.SeedSequence(self.seed.entropy,
+                                               spawn_key=spawnKey + (i,))
+                setattr(self, name, np.random.default_rng(child))
+
+    def state(self):
+        """Return the state of every stream, e.g. for a checkpoint"""
+        return {name: getattr(self, name).bit_generator.state
+                for name in STREAMS}
+
+    def setState(self, state):
+        """Restore the streams to a state returned by self.state"""
+        for name in STREAMS:
+            getattr(self, name).bit_generator.state = state[name]
@@ -0,0 +1,101 @@
+"""
+Many new events described as arrays
+
+A generator function that makes a lot of similar events can return a
+SpawnBatch instead of a list of TransientEvent objects. A survey with
+an EventStore writes the whole batch into the store with array
+operations, and only makes a TransientEvent object for an event when
+somebody asks for it. Other surveys turn the batch into ordinary
+events with SpawnBatch.makeEvents.
+"""
+
+import numpy as np
+from .TransientEvent import TransientEvent, zeroFunction
+
+class SpawnBatch:
+    """
+    Args:
+        birthLocs:
+            N x 5 float array. The birthLoc of every event,
+                [birth time, x, y, xdot, ydot]
+        lifetimes:
+            Length N array. Number of frames every event lives.
+                Truncated to integers, like TransientEvent.lifetime
+        classIDs:
+            The classID of every event: a length N array, or one
+                value shared by all events
+        luminositySeries:
+            Luminosity template (see TransientEvent). Either one
+                series shared by every event, or a list of series
+                if templates is given
+        templates:
+            Length N integer array or None. The series in
+                luminositySeries that each event uses
+        noiseFunction:
+            Luminosity noise function of every event
+                (see TransientEvent). Events with noise are
+                advanced one at a time, so leave it out when speed
+                matters
+        noiseExtraArgs:
+            Extra args of noiseFunction
+    """
+    def __init__(self, birthLocs, lifetimes, classIDs,
+                 luminositySeries=[1], templates=None,
+                 noiseFunction=zeroFunction, noiseExtraArgs=[]):
+        self.birthLocs = np.asarray(birthLocs, dtype=np.float64)
+        if self.birthLocs.ndim != 2 or self.birthLocs.shape[1] != 5:
+            raise ValueError("birthLocs must have shape (N, 5)")
+        n = len(self.birthLocs)
+
+        self.lifetimes = np.asarray(lifetimes).astype(np.int64)
+        if self.lifetimes.shape != (n,):
+            raise ValueError("lifetimes must have one entry per event")
+
+        if np.ndim(classIDs) == 0:
+            self.classIDs = np.full(n, classIDs, dtype=object)
+        else:
+            self.classIDs = np.asarray(classIDs)
+            if len(self.classIDs) != n:
+                raise ValueError("classIDs must have one entry per event")
+
+        if templates is None:
+            self.series = [np.asarray(luminositySeries, dtype=np.float64)]
+            self.templates = np.zeros(n, dtype=np.int64)
+        else:
+            self.series = [np.asarray(series, dtype=np.float64)
+                           for series in luminositySeries]
+            self.templates = np.asarray(templates, dtype=np.int64)
+            if self.templates.shape != (n,):
+                raise ValueError("templates must have one entry per event")
+        if any(series.ndim != 1 or len(series) == 0
+               for series in self.series):
+            raise ValueError("luminosity series must be non-empty 1D")
+
+        self.noiseFunc = noiseFunction
+        self.nArgs = noiseExtraArgs
+
+    def __len__(self):
+        return len(self.birthLocs)
+
+    def noise(self, lum, loc, lifetime, rng=None):
+        """Return the luminosity noise of one event of the batch
+
+        Mirrors TransientEvent.noise
+        """
+        if getattr(self.noiseFunc, "takesRNG", False):
+            return self.noiseFunc(lum, loc, lifetime, *self.nArgs, rng=rng)
+        return self.noiseFunc(lum, loc, lifetime, *self.nArgs)
+
+    def makeEvents(self, rng=None):
+        """Return the batch as a list of TransientEvent objects
+
+        Args:
+            rng:
+                Passed on to every TransientEvent
+        """
+        return [TransientEvent(self.birthLocs[i].tolist(),
+                               self.lifetimes[i], self.classIDs[i],
+                               self.noiseFunc, self.nArgs,
+                               self.series[self.templates[i]].tolist(),
+                               rng=rng)
+                for i in range(len(self))]
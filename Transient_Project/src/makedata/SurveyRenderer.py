@@ -0,0 +1,136 @@
+"""
+Turn the events of a survey into intensity images
+
+Every frame of a survey becomes an n by m image (the surveyShape of the
+generator) in which each live event adds its luminosity at its pixel,
+optionally spread out by a PSF kernel. Whole surveys are rendered one
+frame at a time into a disk-backed np.memmap cube, so surveys larger
+than memory can be rendered, and processInChunks runs image tools
+(e.g. tools.FOV) over such a cube a few frames at a time.
+
+Positions follow surveyShape: an event at (x, y) lands in pixel
+(floor(x), floor(y)) of the image, where x indexes the first axis.
+Events outside the image are left out.
+"""
+
+import numpy as np
+
+class SurveyRenderer:
+    """
+    Args:
+        shape:
+            Pixel shape of the images. Defaults to the surveyShape of
+                the survey's generator
+        psf:
+            2D array or None. Kernel every event is spread with,
+                centered on the event's pixel (odd side lengths put
+                the center on a pixel). The kernel is used as given, so
+                normalize it to keep the total luminosity. None puts
+                every event in a single pixel
+        dtype:
+            dtype of the images
+    """
+    def __init__(self, shape=None, psf=None, dtype=np.float32):
+        self.shape = None if shape is None else tuple(shape)
+        self.dtype = np.dtype(dtype)
+        if psf is None:
+            self.offsets = np.zeros((1, 2), dtype=np.int64)
+            self.weights = np.ones(1)
+        else:
+            psf = np.asarray(psf, dtype=float)
+            if psf.ndim != 2:
+                raise ValueError("psf must be a 2D array")
+            di, dk = np.nonzero(psf)
+            self.weights = psf[di, dk]
+            self.offsets = np.stack([di - psf.shape[0]//2,
+                                     dk - psf.shape[1]//2], axis=1)
+
+    def imageShape(self, survey):
+        """Return the pixel shape of the images of survey"""
+        if self.shape is not None:
+            return self.shape
+        return tuple(int(n) for n in survey.generator.surveyShape)
+
+    def renderFrame(self, survey, i, out=None):
+        """Return the image of frame i of the survey
+
+        Args:
+            survey:
+                The TransientSurvey to render
+            i:
+                Frame number
+            out:
+                Optional array of the image shape to write the image to
+        """
+        shape = self.imageShape(survey)
+        eventIds, indices = survey.frames.frame(i)
+        rows = survey.historyRows(eventIds, indices)
+
+        #Every event is added once per nonzero kernel entry
+        pixelI = np.floor(rows[:, 1]).astype(np.int64)
+        pixelK = np.floor(rows[:, 2]).astype(np.int64)
+        pixelI = (pixelI[:, None] + self.offsets[:, 0]).ravel()
+        pixelK = (pixelK[:, None] + self.offsets[:, 1]).ravel()
+        lum = (rows[:, 5][:, None]*self.weights).ravel()
+        inside = ((pixelI >= 0) & (pixelI < shape[0])
+                  & (pixelK >= 0) & (pixelK < shape[1]))
+
+        #Sparse accumulation: events sharing a pixel add up
+        image = np.bincount(pixelI[inside]*shape[1] + pixelK[inside],
+                            weights=lum[inside],
+                            minlength=shape[0]*shape[1]).reshape(shape)
+        if out is None:
+            return image.astype(self.dtype)
+        out[...] = image
+        return out
+
+    def renderToMemmap(self, survey, filename, frames=None):
+        """Render frames of the survey into a disk-backed image cube
+
+        Args:
+            survey:
+                The TransientSurvey to render
+            filename:
+                File of the np.memmap. Overwritten
+            frames:
+                Iterable of frame numbers. Defaults to every frame.
+                    A survey with no frames (or an empty iterable)
+                    raises ValueError, as np.memmap cannot be empty
+        Returns:
+            np.memmap of shape (frames, rows, columns)
+        """
+        if frames is None:
+            frames = range(len(survey.frames))
+        frames = list(frames)
+        if not frames:
+            raise ValueError("no frames to render")
+        shape = self.imageShape(survey)
+        cube = np.memmap(filename, dtype=self.dtype, mode="w+",
+                         shape=(len(frames),) + shape)
+        for j, i in enumerate(frames):
+            self.renderFrame(survey, i, out=cube[j])
+        cube.flush()
+        return cube
+
+def processInChunks(cube, function, chunkFrames=16):
+    """Run an image tool over an image cube, a few frames at a time
+
+    Args:
+        cube:
+            Array (or np.memmap) of shape (frames, rows, columns).
+                Changed in place
+        function:
+            Function that takes a (chunkFrames, rows, columns) array
+                and returns an array of the same shape, such as
+                lambda chunk: FOV.apply_circle_fov(chunk, radius, loc)
+        chunkFrames:
+            Number of frames per chunk
+    Returns:
+        cube
+    """
+    for start in range(0, len(cube), chunkFrames):
+        chunk = cube[start:start + chunkFrames]
+        chunk[...] = function(chunk)
+    if isinstance(cube, np.memmap):
+        cube.flush()
+    return cube
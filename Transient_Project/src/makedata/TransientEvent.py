@@ -5,17 +5,146 @@ Class to hold an individual event
 
 import numpy as np
 import copy
+from .DetectionLog import DetectionLog
 
 def zeroFunction(lum=0, loc=0, lifetime=0):
     return 0.0
 
+#Number of values in one row of an event's history
+#   [time, x, y, xdot, ydot, lum]
+HISTORY_WIDTH = 6
+
+#Number of history rows allocated for a new event. The history
+#   doubles as the event needs more, up to its lifetime, so that
+#   long-lived events that a survey never runs to the end of do not
+#   hold their whole lifetime in memory
+INITIAL_HISTORY_ROWS = 64
+
+#Stream for noise functions marked with RandomStreams.takesRNG that
+#   belong to events outside of any survey
+_FALLBACK_RNG = np.random.default_rng()
+
+class _StoredAttribute:
+    """Event attribute that lives in an EventStore column once attached
+
+    Until the event is attached, the value is read from position
+    locIndex of event.loc, or from the private slot if locIndex is None
+    """
+    def __init__(self, column, locIndex=None):
+        self.column = column
+        self.locIndex = locIndex
+        self.private = "_" + column
+
+    def __get__(self, event, owner=None):
+        if event is None:
+            return self
+        if event._slot is not None:
+            return getattr(event._context.store, self.column)[event._slot]
+        if self.locIndex is None:
+            return getattr(event, self.private)
+        return event._loc[self.locIndex]
+
+    def __set__(self, event, value):
+        if event._slot is not None:
+            store = event._context.store
+            store._own()
+            getattr(store, self.column)[event._slot] = value
+        elif self.locIndex is None:
+            setattr(event, self.private, value)
+        else:
+            event._loc[self.locIndex] = value
+
+class DetectionHistory:
+    """Read-only view of an event's detections
+
+    Only the history index and the detector noise of each detection
+    are stored (in the event's DetectionLog). The ith entry is rebuilt
+    on access in the form
+        [time, index, (x, y), lum, noise]
+    """
+    __slots__ = ("event", "_indices", "_noise")
+
+    def __init__(self, event):
+        self.event = event
+        if event._context is None:
+            self._indices = np.zeros(0, dtype=np.int64)
+            self._noise = np.zeros(0)
+        else:
+            self._indices, self._noise = event._context.detections.forEvent(
+                                                            event._eventId)
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        index = int(self._indices[i])
+        row = self.event.history[index]
+        return [row[0], index, (row[1], row[2]), row[5], self._noise[i]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def indices(self):
+        """Return the history indices of the detections as an array"""
+        return self._indices
+
+    def noise(self):
+        """Return the detector noise of the detections as an array"""
+        return self._noise
+
+class EventContext:
+    """Where an event finds the state it shares with its survey
+
+    Events that live in an EventStore read their time, position and
+    history out of context.store, and every event keeps its detections
+    in context.detections. Every survey has a context of its own. Forks
+    of a survey start out sharing event objects, and hand out copies
+    bound to their own context (see TransientEvent.bind) instead, so an
+    event always reads the state of the survey it came from.
+
+    Args:
+        store:
+            EventStore or None
+        detections:
+            DetectionLog. A new one is made if not given
+        random:
+            RandomStreams of the survey, or None
+    """
+    __slots__ = ("store", "detections", "random")
+
+    def __init__(self, store=None, detections=None, random=None):
+        self.store = store
+        if detections is None:
+            detections = DetectionLog()
+        self.detections = detections
+        self.random = random
+
 class TransientEvent:
     """
     """
-    def __init__(self, birthLoc, lifetime, classID, 
+    __slots__ = ("classID", "_loc", "_lum", "nArgs", "_traj", "_length",
+                 "_context", "_eventId", "lifetime", "noiseFunc",
+                 "movementFunction", "velocityFunction",
+                 "luminositySeries", "_markedForDeath", "eventID",
+                 "_slot", "__weakref__")
+
+    time = _StoredAttribute("time", 0)
+    x = _StoredAttribute("x", 1)
+    y = _StoredAttribute("y", 2)
+    xdot = _StoredAttribute("xdot", 3)
+    ydot = _StoredAttribute("ydot", 4)
+    lum = _StoredAttribute("lum")
+
+    def __init__(self, birthLoc, lifetime, classID,
                  noiseFunction = zeroFunction, noiseExtraArgs = [],
-                 luminositySeries = None, movementFunction = None, 
-                 velocityFunction = None):
+                 luminositySeries = None, movementFunction = None,
+                 velocityFunction = None, rng = None):
         """
         Arguments:
             birthloc: length 5 list. Positions:
@@ -23,9 +152,9 @@ class TransientEvent:
                 1: birth x-location
                 2: birth y-location
                 3: x-velocity
-                4: y-velocity                
+                4: y-velocity
             lifetime: float. Number of frames
-            luminositySeries: Iterable of luminosities as fractions of 
+            luminositySeries: Iterable of luminosities as fractions of
                 maximum reportable luminosity. The ith entry in the
                 iterable represents the luminosity on the ith frame
                 of its existance
@@ -36,94 +165,273 @@ class TransientEvent:
                 function that adds noise to even luminosity
                 Arguments (in this order):
                     lum, loc, lifetime, *noiseExtraArgs
+                Functions marked with RandomStreams.takesRNG are
+                    also given the keyword argument rng: the
+                    eventNoise stream of the event's survey
             noiseExtraArgs:
                 This is for other arguments that the noise function
-                may require. 
+                may require.
             velocityFunction:
-                
-                Args: 
+
+                Args:
                     timeSinceBirth: simulation ticks since event spawn
                 Returns:
                     Velocity to use for next time step format (xvel, yvel)
             movementFunction:
                 OVERRIDES VELOCITY FUNCTION IF DEFINED
-                Args: 
+                Args:
                     timeSinceBirth: simulation ticks since event spawn
                 Returns:
                     position to use for next time step format (x, y)
-            
+            rng:
+                np.random.Generator for the birth luminosity noise of
+                    noise functions marked with takesRNG. Generator
+                    functions should pass survey.random.eventNoise
+
         """
+        self._context = None
+        self._slot = None
         self.classID = classID
-        self.loc = birthLoc
-        self.time = birthLoc[0]
-        self.x = birthLoc[1]
-        self.y = birthLoc[2]
-        self.xdot = birthLoc[3]
-        self.ydot = birthLoc[4]
+        self._loc = birthLoc
         self.nArgs = noiseExtraArgs
-        self.history = [[self.time,self.x,self.y,self.xdot,self.ydot]]
-        self.detectionHistory = []
+        self._eventId = 0
         self.lifetime = int(lifetime)
         self.noiseFunc = noiseFunction
         self.movementFunction = movementFunction
         self.velocityFunction = velocityFunction
+
+        self._traj = np.empty((max(min(self.lifetime, INITIAL_HISTORY_ROWS),
+                                   1), HISTORY_WIDTH))
+        self._length = 0
         if luminositySeries is None:
-            self.lum = 1 + self.noiseFunc(
-                                1, self.loc, self.lifetime,
-                                *self.nArgs         
-                                         )
+            self.lum = 1 + self.noise(1, self.loc, rng)
             self.luminositySeries = [1]
-            self.history[0] += [1]
+            self._appendHistory(1)
         else:
             self.luminositySeries = luminositySeries
-            self.lum = (self.luminositySeries[0]  
-                            + self.noiseFunc(
-                                        self.luminositySeries[0], 
-                                        self.loc, 
-                                        self.lifetime,
-                                        *self.nArgs))
-            self.history[0] += [self.lum]
+            self.lum = (self.luminositySeries[0]
+                            + self.noise(self.luminositySeries[0],
+                                         self.loc, rng))
+            self._appendHistory(self.lum)
         self.markedForDeath = False
-        self.eventID = np.random.randint(2**64, dtype = np.uint64)
-        self.holisticDetection = False
-        if self.loc[0] - self.history[0][0] + 1 >= self.lifetime:
+
+        #Set from the survey's ids stream when the event is added to it
+        self.eventID = 0
+        if 1 >= self.lifetime:
             self.markedForDeath = True
-        
-    
+
+
+    @classmethod
+    def stored(cls, store, slot, luminositySeries,
+               noiseFunction=zeroFunction, noiseExtraArgs=[]):
+        """Return an event for a store slot that was filled without one
+
+        The event's state is read out of the store, as for any
+        attached event. Used for events spawned from a SpawnBatch.
+
+        Args:
+            store:
+                The EventStore holding the event
+            slot:
+                Index of the event in the store's columns
+            luminositySeries, noiseFunction, noiseExtraArgs:
+                As for TransientEvent
+        """
+        event = cls.__new__(cls)
+        event._context = None
+        event._loc = None
+        event._traj = None
+        event._length = 0
+        event._eventId = 0
+        event._markedForDeath = False
+        event.classID = store.classID[slot]
+        event.lifetime = int(store.lifetime[slot])
+        event.luminositySeries = luminositySeries
+        event.noiseFunc = noiseFunction
+        event.nArgs = noiseExtraArgs
+        event.movementFunction = None
+        event.velocityFunction = None
+        event.eventID = 0
+        event._slot = None
+        event.attach(store, slot)
+        return event
+
+    @property
+    def loc(self):
+        if self._slot is None:
+            return self._loc
+        return [self.time, self.x, self.y, self.xdot, self.ydot]
+
+    @loc.setter
+    def loc(self, value):
+        self._loc = value
+
+    @property
+    def history(self):
+        """Array view of [time, x, y, xdot, ydot, lum] for every frame"""
+        if self._slot is None:
+            return self._traj[:self._length]
+        return self._context.store.history(self._slot)
+
+    @property
+    def detectionHistory(self):
+        return DetectionHistory(self)
+
+    @property
+    def holisticDetection(self):
+        if self._context is None:
+            return False
+        return self._context.detections.isHolistic(self._eventId)
+
+    @holisticDetection.setter
+    def holisticDetection(self, value):
+        if self._context is None:
+            if not value:
+                return
+            self._context = EventContext()
+        self._context.detections.setHolistic(self._eventId, value)
+
+    def noise(self, lum, loc, rng=None):
+        """Return the luminosity noise of the event from its noiseFunction
+
+        Args:
+            lum:
+                Luminosity before noise
+            loc:
+                [time, x, y, xdot, ydot] to evaluate the noise at
+            rng:
+                Stream for noise functions marked with takesRNG.
+                    Defaults to the eventNoise stream of the survey
+        """
+        if not getattr(self.noiseFunc, "takesRNG", False):
+            return self.noiseFunc(lum, loc, self.lifetime, *self.nArgs)
+        if rng is None:
+            if self._context is not None and self._context.random is not None:
+                rng = self._context.random.eventNoise
+            else:
+                rng = _FALLBACK_RNG
+        return self.noiseFunc(lum, loc, self.lifetime, *self.nArgs, rng=rng)
+
+    def register(self, context, eventId):
+        """Make the event part of a survey
+
+        Args:
+            context:
+                The EventContext of the survey the event belongs to
+            eventId:
+                Position of the event in TransientSurvey.events
+        """
+        self._context = context
+        self._eventId = eventId
+
+    @property
+    def markedForDeath(self):
+        if self._slot is None:
+            return self._markedForDeath
+        return not self._context.store.alive[self._slot]
+
+    @markedForDeath.setter
+    def markedForDeath(self, value):
+        if self._slot is None:
+            self._markedForDeath = value
+        else:
+            self._context.store._own()
+            self._context.store.alive[self._slot] = not value
+
+    def _appendHistory(self, lum):
+        """Write the current location and lum to the next history row"""
+        row = list(self._loc[:5]) + [lum]
+        if self._length == len(self._traj):
+            grown = np.empty((max(min(2*self._length, self.lifetime),
+                                  self._length + 1), HISTORY_WIDTH),
+                             dtype=self._traj.dtype)
+            grown[:self._length] = self._traj
+            self._traj = grown
+        try:
+            self._traj[self._length] = row
+        except (TypeError, ValueError):
+            #Luminosities that are not numbers get an object array
+            self._traj = self._traj.astype(object)
+            self._traj[self._length] = row
+        self._length += 1
+
+    def attach(self, store, slot):
+        """Hand the event's state over to an EventStore
+
+        The store keeps its own copy of the trajectory, so the
+        event's history buffer is released.
+
+        Args:
+            store:
+                The EventStore that now advances this event. If the
+                    event was registered with a survey, this must be
+                    the store of the survey's EventContext
+            slot:
+                Index of the event in the store's columns
+        """
+        if self._context is None:
+            self._context = EventContext(store)
+        self._slot = slot
+        self._traj = None
+
+    def bind(self, context):
+        """Return the event as seen through context
+
+        Returns self if the event already belongs to context, otherwise
+        a shallow copy that reads its store, detections and noise
+        stream from context. The copy shares everything else with self,
+        including an unstored event's location and history (see fork).
+        """
+        if self._context is context:
+            return self
+        clone = copy.copy(self)
+        clone._context = context
+        return clone
+
+    def fork(self):
+        """Return a copy of the event that can be advanced on its own
+
+        Only needed for events that are not in an EventStore. The copy
+        shares everything but its location and history with self.
+        """
+        clone = copy.copy(self)
+        clone._loc = list(self._loc)
+        clone._traj = self._traj.copy()
+        return clone
+
     def advanceEvent(self):
         """Advance the event simulation by one tick"""
-        if not self.markedForDeath:
-            self.loc[0] += 1
-            timeSinceBirth = self.loc[0] - self.history[0][0]
+        #Events in an EventStore are advanced by the store
+        if self._slot is None and not self.markedForDeath:
+            loc = self._loc
+            loc[0] += 1
+            timeSinceBirth = self._length
             if self.velocityFunction is not None:
-                self.loc[3], self.loc[4] = self.velocityFunction(timeSinceBirth)
-            self.loc[1] += self.loc[3]
-            self.loc[2] += self.loc[4]
-            
+                loc[3], loc[4] = self.velocityFunction(timeSinceBirth)
+            loc[1] += loc[3]
+            loc[2] += loc[4]
+
             if self.movementFunction is not None:
-                self.loc[1], self.loc[2] = self.movementFunction(timeSinceBirth)
-            [self.time,self.x,self.y,self.xdot,self.ydot] = self.loc
+                loc[1], loc[2] = self.movementFunction(timeSinceBirth)
 
             self.lum = (self.luminositySeries[
                                 timeSinceBirth % len(self.luminositySeries)
                                              ])
-            self.lum += self.noiseFunc(
-                                self.lum, 
-                                self.loc, 
-                                self.lifetime,
-                                *self.nArgs)
-            self.history.append(
-                                [self.time,self.x,self.y,self.xdot,self.ydot] 
-                            + [self.lum])
-            
+            self.lum += self.noise(self.lum, loc)
+            self._appendHistory(self.lum)
+
             #The +1 here accounts for timesincebirth being 1 fewer
             #than the number of frames the event has been alive
             if timeSinceBirth + 1 >= self.lifetime:
                 self.markedForDeath = True
-    
+
     def recordDetection(self, index, noise):
-        """Record the time of detection, and the relevant luminosity 
-        
+        """Record the time of detection, and the relevant luminosity
+
+        Only the index and the noise are kept. The time, position
+        and luminosity are read back out of self.history by
+        self.detectionHistory
+
         Args:
             index:
                 The index in self.history corresponding to
@@ -132,14 +440,11 @@ class TransientEvent:
                 Noise to be added to luminosity. Represents noise
                     in the detector, not noise in the event's luminosity
         """
-        i = index
-        time = self.history[i][0]
-        pos = (self.history[i][1], self.history[i][2])
-        lum = self.history[i][5]
-        self.detectionHistory.append([time, index, pos, lum, noise])
+        if self._context is None:
+            self._context = EventContext()
+        self._context.detections.recordOne(self._eventId, index, noise)
 
     def clearDetectionHistory(self):
         """Empty detectionHistory and remove holistic detection"""
-        self.holisticDetection = False
-        self.detectionHistory = []
-
+        if self._context is not None:
+            self._context.detections.clearEvent(self._eventId)
@@ -6,6 +6,7 @@ events between frames of TransientSurvey
 """
 
 import numpy as np
+from .SpawnBatch import SpawnBatch
 
 TRANS_REQD_ARGS = {"generatorFunction": 3}
 
@@ -19,7 +20,11 @@ class TransientGenerator:
             
             generatorFunction: 
                 List of Functions used to make new events.
-                Returns: List of TransientEvent objects
+                Returns: List of TransientEvent objects, or a
+                    SpawnBatch describing many events as arrays.
+                    Batches are ingested without building an object
+                    per event, so prefer them for large numbers of
+                    simple events
                     Args: 
                         currentFrameNumber:
                             The current frame of the simulation
@@ -34,6 +39,10 @@ class TransientGenerator:
                     a unique object (e.g. the moon), the generator
                     functions need to be able to check if that object
                     already exists.
+                    Random numbers should be drawn from
+                    survey.random.generation, and the events made
+                    with rng=survey.random.eventNoise, so that
+                    seeded surveys are reproducible.
             extraArgs: 
                 List of lists. The ith element in extraArgs
                 is the extra arguments passed to the ith function
@@ -58,12 +67,21 @@ class TransientGenerator:
         self.charBias = genFuncCharBias
 
     def generate(self, currentFrameNumber, survey):
+        """Return the new events of every generator function
+
+        Returns:
+            List of TransientEvent and SpawnBatch objects
+        """
         newEvents = []
         for i in range(len(self.generatorFunctions)):
-            newEvents += self.generatorFunctions[i](
+            spawned = self.generatorFunctions[i](
                                     currentFrameNumber, 
                                     self.surveyShape, 
                                     survey,
                                     *self.eArgs[i])
+            if isinstance(spawned, SpawnBatch):
+                newEvents.append(spawned)
+            else:
+                newEvents += spawned
         return newEvents
         
\ No newline at end of file
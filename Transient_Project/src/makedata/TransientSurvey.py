@@ -4,6 +4,162 @@ Top level class that handles the generation of the survey data
 
 import numpy as np
 import copy
+from collections.abc import Sequence
+from .EventStore import EventStore
+from .FrameIndex import FrameIndex
+from .DetectionLog import DetectionLog
+from .ObservingProfile import sameStage
+from .TransientEvent import HISTORY_WIDTH, EventContext
+from .RandomStreams import RandomStreams
+from .SpawnBatch import SpawnBatch
+from .ExpirationWheel import ExpirationWheel
+
+#Attributes of a survey that TransientSurvey.fork shares or copies
+#   itself. Every other attribute, such as the generator or state that
+#   generator functions keep on the survey, is deep-copied
+FORK_MANAGED = ("profile", "events", "liveObjects",
+                "liveObjectIds", "retired", "deaths", "store", "eventSlots",
+                "frames", "frameEvents", "detections", "context",
+                "stageCache", "stageKeys", "gen")
+
+class SurveyEvents(Sequence):
+    """Every event of a survey, in the order they were added
+
+    Events spawned from a SpawnBatch have no TransientEvent object
+    until one is asked for. Their entry in objects is None until then.
+    A fork starts out with the objects of its parent, which are
+    replaced by copies bound to the fork's EventContext as they are
+    asked for.
+    """
+    def __init__(self, survey, objects=None):
+        self.survey = survey
+        self.objects = [] if objects is None else objects
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        event = self.objects[i]
+        if event is None or event._context is not self.survey.context:
+            if i < 0:
+                i += len(self)
+            event = self.survey.ownEvent(i, event)
+            self.objects[i] = event
+        return event
+
+    def __setitem__(self, i, event):
+        self.objects[i] = event
+
+    def __iter__(self):
+        context = self.survey.context
+        for i, event in enumerate(self.objects):
+            if event is None or event._context is not context:
+                event = self[i]
+            yield event
+
+    def extend(self, events):
+        self.objects.extend(events)
+
+    def reserve(self, n):
+        """Add n events that do not have objects yet"""
+        self.objects.extend([None]*n)
+
+    def fork(self, survey):
+        """Return a copy of the list belonging to survey"""
+        return SurveyEvents(survey, list(self.objects))
+
+class DeadEvents(Sequence):
+    """Read-only view of the dead events of a survey, in the order they died
+
+    The survey keeps the ids of its dead events as a list of arrays,
+    survey.retired, one array per batch of deaths.
+    """
+    def __init__(self, survey):
+        self.survey = survey
+
+    def ids(self):
+        """Return the positions of the dead events in survey.events"""
+        retired = self.survey.retired
+        if len(retired) > 1:
+            retired[:] = [np.concatenate(retired)]
+        if not retired:
+            return np.zeros(0, dtype=np.int64)
+        return retired[0]
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.survey.retired)
+
+    def __getitem__(self, i):
+        events = self.survey.events
+        if isinstance(i, slice):
+            return [events[e] for e in self.ids()[i].tolist()]
+        return events[self.ids()[i]]
+
+    def __iter__(self):
+        events = self.survey.events
+        for e in self.ids().tolist():
+            yield events[e]
+
+class FrameEvents(Sequence):
+    """Read-only view of a survey's frames in the FrameEvents convention
+
+    The ith entry is the list of (event, index) pairs alive in frame i,
+    where index is the index in event.history that corresponds to
+    frame i. The pairs are built on access from survey.frames.
+    """
+    def __init__(self, survey):
+        self.survey = survey
+
+    def __len__(self):
+        return len(self.survey.frames)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        eventIds, indices = self.survey.frames.frame(i)
+        events = self.survey.events
+        return list(zip([events[e] for e in eventIds.tolist()],
+                        indices.tolist()))
+
+class LivingEvents(Sequence):
+    """Read-only view of the events that are alive in a survey
+
+    Events held in the survey's EventStore come first, followed by
+    the events that are advanced one at a time. The view is cheap to
+    make and always reflects the current state of the survey.
+    """
+    def __init__(self, survey):
+        self.survey = survey
+
+    def _slots(self):
+        if self.survey.store is None:
+            return ()
+        return self.survey.store.liveSlots()
+
+    def __len__(self):
+        return len(self._slots()) + len(self.survey.liveObjects)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        slots = self._slots()
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("LivingEvents index out of range")
+        if i < len(slots):
+            return self.survey.events[self.survey.store.eventIndex[slots[i]]]
+        return self.survey.liveObjects[i - len(slots)]
+
+    def __iter__(self):
+        slots = self._slots()
+        if len(slots) > 0:
+            events = self.survey.events
+            for eventId in self.survey.store.eventIndex[slots].tolist():
+                yield events[eventId]
+        yield from self.survey.liveObjects
 
 class TransientSurvey:
     """
@@ -13,96 +169,480 @@ class TransientSurvey:
                 events
         profile:
             ObservingProfile object which determines sight
+        columnar:
+            bool. If True, events without a velocityFunction or
+                movementFunction are kept in an EventStore and
+                advanced together with array operations. All other
+                events are still advanced one at a time.
+        seed:
+            Seed of the survey's RandomStreams (self.random). Plugins
+                draw their random numbers from self.random, so two
+                surveys with the same seed produce the same data.
+                None seeds from the OS
+        retireOnDeath:
+            bool. If True, the holistic detection of every event is
+                evaluated as soon as it dies, instead of for every
+                event at the end of a run, and dead events spawned
+                from a SpawnBatch drop their TransientEvent objects
+                (they are rebuilt from the store if asked for). The
+                holisticDetection function must then only depend on
+                the event itself.
             
     """
 
-    def __init__(self, generator, profile):
+    def __init__(self, generator, profile, columnar=False, seed=None,
+                 retireOnDeath=False):
         self.generator = generator 
         self.profile = profile
-        self.events = []
-        self.frameEvents = []
-        self.absoluteTime = -1
+        self.columnar = columnar
+        self.retireOnDeath = retireOnDeath
+        self.random = RandomStreams(seed)
+        self.resetSurvey()
         self.gen = self.generator.generate
 
+    def ownLiveObjects(self):
+        """Copy the living non-store events shared with a fork"""
+        if not self.sharedObjects:
+            return
+        owned = []
+        for event, eventId in zip(self.liveObjects, self.liveObjectIds):
+            clone = event.fork()
+            self.events[eventId] = clone
+            owned.append(clone)
+        self.liveObjects = owned
+        self.sharedObjects = False
+
+    def advanceEvents(self):
+        """Tick every event and record the new frame in self.frames"""
+        self.ownLiveObjects()
+        self.absoluteTime += 1
+
+        #Deaths were scheduled in self.deaths when the events were born
+        dying = self.deaths.expire(self.absoluteTime)
+        dyingSlots = self.eventSlots[dying]
+        inStore = dyingSlots >= 0
+
+        #Record what events are alive in this frame,
+        #   and what index in its history this frame is
+        #Only living events are visited. The ones that die
+        #   this tick are moved over to retired
+        frameIds = []
+        frameIndices = []
+        if self.store is not None:
+            slots, indices, _ = self.store.advance(self.random.eventNoise,
+                                                   dyingSlots[inStore])
+            frameIds.append(self.store.eventIndex[slots])
+            frameIndices.append(indices)
+        survivors = []
+        survivorIds = []
+        objectIndices = []
+        dyingObjects = set(dying[~inStore].tolist())
+        for event, eventId in zip(self.liveObjects, self.liveObjectIds):
+            event.advanceEvent()
+            if eventId not in dyingObjects:
+                survivors.append(event)
+                survivorIds.append(eventId)
+                objectIndices.append(len(event.history) - 1)
+        self.liveObjects = survivors
+        self.liveObjectIds = survivorIds
+        if len(dying) > 0:
+            self.retired.append(dying)
+            if self.retireOnDeath:
+                self.retireDeadEvents(dying)
+        frameIds.append(np.asarray(survivorIds, dtype=np.int64))
+        frameIndices.append(np.asarray(objectIndices, dtype=np.int64))
+        self.frames.append(np.concatenate(frameIds),
+                           np.concatenate(frameIndices))
+
+    def addEvents(self, newEvents):
+        """Add freshly generated events to the survey
+
+        Args:
+            newEvents:
+                List of TransientEvent and SpawnBatch objects
+        """
+        events = []
+        for item in newEvents:
+            if isinstance(item, SpawnBatch):
+                self.addEventObjects(events)
+                events = []
+                self.addSpawnBatch(item)
+            else:
+                events.append(item)
+        self.addEventObjects(events)
+
+    def addEventObjects(self, newEvents):
+        """Add a list of TransientEvent objects to the survey"""
+        firstId = len(self.events)
+        eventId = firstId
+        self.events.extend(newEvents)
+        eventIDs = self.eventIDs(np.arange(firstId, len(self.events)))
+        slots = []
+        deadIds = []
+        livingIds = []
+        deathFrames = []
+        for event, eventID in zip(newEvents, eventIDs):
+            event.register(self.context, eventId)
+            event.eventID = eventID
+            if self.store is not None and self.store.accepts(event):
+                slots.append(self.store.add(event, eventId))
+            else:
+                slots.append(-1)
+                if not event.markedForDeath:
+                    self.liveObjects.append(event)
+                    self.liveObjectIds.append(eventId)
+            if event.markedForDeath:
+                deadIds.append(eventId)
+            else:
+                livingIds.append(eventId)
+                deathFrames.append(self.absoluteTime + event.lifetime - 1)
+            eventId += 1
+        self.setEventSlots(firstId, slots)
+        self.deaths.schedule(livingIds, deathFrames)
+        if deadIds:
+            self.retired.append(np.asarray(deadIds, dtype=np.int64))
+            if self.retireOnDeath:
+                self.retireDeadEvents(self.retired[-1])
+
+    def addSpawnBatch(self, batch):
+        """Add every event of a SpawnBatch to the survey
+
+        With an EventStore the batch is written into the store with
+        array operations and no TransientEvent objects are made.
+        Otherwise the batch is turned into events one at a time.
+        """
+        if self.store is None:
+            self.addEventObjects(batch.makeEvents(self.random.eventNoise))
+            return
+        firstId = len(self.events)
+        slots = self.store.addBatch(batch, firstId, self.random.eventNoise)
+        self.events.reserve(len(batch))
+        self.setEventSlots(firstId, slots)
+        alive = self.store.alive[slots]
+        self.deaths.schedule(np.flatnonzero(alive) + firstId,
+                             self.absoluteTime + batch.lifetimes[alive] - 1)
+        dead = np.flatnonzero(~alive)
+        if len(dead) > 0:
+            self.retired.append(dead + firstId)
+            if self.retireOnDeath:
+                self.retireDeadEvents(self.retired[-1])
+
+    def retireDeadEvents(self, eventIds):
+        """Settle the events that just died, for retireOnDeath
+
+        A dead event is in no later frame, so its detections are
+        final and its holistic detection can be evaluated right away.
+        Spawned events then drop their TransientEvent objects.
+
+        Args:
+            eventIds:
+                Integer array. Positions of the dead events in self.events
+        """
+        self.profile.holisticDetect([self.events[e] for e in eventIds],
+                                    self)
+        if self.store is None:
+            return
+        slots = self.eventSlots[eventIds]
+        stored = slots >= 0
+        spawned = self.store.batch[slots[stored]] >= 0
+        for eventId, slot in zip(eventIds[stored][spawned].tolist(),
+                                 slots[stored][spawned].tolist()):
+            self.events[eventId] = None
+            self.store.events[slot] = None
+
+    def setEventSlots(self, firstId, slots):
+        """Remember which store slot, if any, new events live in
+
+        Args:
+            firstId:
+                Position in self.events of the first new event
+            slots:
+                Store slot of every new event, -1 if not in the store
+        """
+        if len(self.events) > len(self.eventSlots):
+            grown = np.zeros(max(len(self.events), 2*len(self.eventSlots)),
+                             dtype=np.int64)
+            grown[:firstId] = self.eventSlots[:firstId]
+            self.eventSlots = grown
+        self.eventSlots[firstId:len(self.events)] = slots
+
+    def eventIDs(self, eventIds):
+        """Return the eventID of the events at positions eventIds
+
+        Ids are counted up from a random base drawn when the survey
+        is reset, so they are unique within the survey and cost
+        nothing to make.
+        """
+        return np.add(np.asarray(eventIds, dtype=np.uint64), self.idBase,
+                      dtype=np.uint64)
+
+    def spawnedEvent(self, eventId):
+        """Return a new TransientEvent object for a spawned event
+
+        Args:
+            eventId:
+                Position in self.events of an event added from a
+                    SpawnBatch that has no object yet
+        """
+        slot = self.eventSlots[eventId]
+        made = self.store.events[slot] is None
+        event = self.store.event(slot)
+        if not made:
+            #The store's object may belong to a survey this one was
+            #   forked from or to
+            event = event.bind(self.context)
+        event.register(self.context, eventId)
+        event.eventID = self.eventIDs([eventId])[0]
+        return event
+
+    def ownEvent(self, eventId, event):
+        """Return the object of an event, bound to this survey's context
+
+        Args:
+            eventId:
+                Position of the event in self.events
+            event:
+                The entry of self.events.objects at eventId: None for a
+                    spawned event without an object, or an object that
+                    may belong to another survey of the same fork family
+        """
+        if event is None:
+            return self.spawnedEvent(eventId)
+        return event.bind(self.context)
+
+    def historyRows(self, eventIds, indices):
+        """Return the history rows of many events at once
+
+        Args:
+            eventIds:
+                Integer array. Positions of the events in self.events
+            indices:
+                Integer array. The index into each event's history
+        Returns:
+            N x 6 float array of [time, x, y, xdot, ydot, lum] rows
+        """
+        rows = np.empty((len(eventIds), HISTORY_WIDTH))
+        slots = self.eventSlots[eventIds]
+        inStore = slots >= 0
+        if self.store is not None and inStore.any():
+            storeRows = (self.store.histStart[slots[inStore]]
+                         + indices[inStore])
+            rows[inStore] = self.store.traj[storeRows]
+        for k in np.flatnonzero(~inStore):
+            rows[k] = self.events[eventIds[k]].history[indices[k]]
+        return rows
+
+    def invalidateDetectionCache(self):
+        """Forget the cached results of the frame detection stages
+
+        Call this if a detection function depends on something other
+        than its extra args, so that the next re-detection runs every
+        stage again.
+        """
+        self.stageCache = []
+        self.stageKeys = None
+
+    def currentStageKeys(self):
+        """Return the profile's stage keys
+
+        The same object is returned for as long as the profile's
+        detection functions and their args stay the same
+        """
+        keys = self.profile.stageKeys()
+        if self.stageKeys is None or not all(
+                sameStage(old, new) for old, new in zip(self.stageKeys, keys)):
+            self.stageKeys = keys
+        return self.stageKeys
+
+    def detectFrame(self, i, stages=None):
+        """Run the profile's frame detection on frame i
+
+        The result of every stage is cached together with the
+        functions and args that produced it.
+
+        Args:
+            i:
+                The frame to detect
+            stages:
+                Optional stage results to reuse.
+                    See ObservingProfile.frameDetectArrays
+        """
+        keys = self.currentStageKeys()
+        eventIds, indices = self.frames.frame(i)
+        stages = self.profile.frameDetectArrays(i, eventIds, indices, self,
+                                                stages)
+        while len(self.stageCache) <= i:
+            self.stageCache.append(None)
+        self.stageCache[i] = (keys, stages)
+
+    def reusableStages(self, i, keys):
+        """Return the cached stage results of frame i that are still valid
+
+        Returns:
+            None if nothing has to be recomputed for frame i, otherwise
+            a stages list for ObservingProfile.frameDetectArrays with
+            every stage downstream of the first changed one set to None
+        """
+        if i >= len(self.stageCache) or self.stageCache[i] is None:
+            return [None, None, None]
+        frameKeys, stages = self.stageCache[i]
+        if frameKeys is keys:
+            return None
+        for stage in range(len(stages)):
+            if not sameStage(frameKeys[stage], keys[stage]):
+                return stages[:stage] + [None]*(len(stages) - stage)
+        return None
+
     def advance(self):
         """
         Advance the simulation by one frame
         """
         #tick existing things
-        self.absoluteTime += 1
-        self.frameEvents.append([])
-        for event in self.events:
-            event.advanceEvent()
-            
-            #Record what events are alive in this frame,
-            #   and what index in its history this frame is
-            if not event.markedForDeath:
-                index = len(event.history) - 1
-                self.frameEvents[-1].append((event, index))
+        self.advanceEvents()
         
         #Detect the next frame of events.
         #Here we decide to exclude new events from the detection
             #calculus. 
             #i.e. you will never detect the first frame
-        if len(self.frameEvents) > 0:
-            self.profile.frameDetect(self.absoluteTime, 
-                                     self.frameEvents[-1], self)
+        if len(self.frames) > 0:
+            self.detectFrame(self.absoluteTime)
         
         #generate new events
-        self.events += self.gen(self.absoluteTime, self)
+        self.addEvents(self.gen(self.absoluteTime, self))
 
     def advanceWithoutDetection(self):
         """Advance the simulation without checking for detection"""
-        self.absoluteTime += 1
-        self.frameEvents.append([])
-        for event in self.events:
-            event.advanceEvent()
-            if not event.markedForDeath:
-                index = len(event.history) - 1
-                self.frameEvents[-1].append((event, index))
-        self.events += self.gen(self.absoluteTime, self)
+        self.advanceEvents()
+        self.addEvents(self.gen(self.absoluteTime, self))
     
+    def holisticDetectEvents(self):
+        """Run holistic detection on every event that needs it
+
+        With retireOnDeath the dead events were settled when they
+        died, so only the living ones are visited
+        """
+        if self.retireOnDeath:
+            self.profile.holisticDetect(self.getLivingEvents(), self)
+        else:
+            self.profile.holisticDetect(self.events, self)
+
     def getHolisticDetectedEvents(self):
         """Return holistic detected events"""
-        detectedEvents = []
-        self.profile.holisticDetect(self.events, self)
-        for event in self.events:
-            if event.holisticDetection:
-                detectedEvents.append(event)
-        return detectedEvents
+        self.holisticDetectEvents()
+        detected = np.flatnonzero(
+                        self.detections.holistic[:len(self.events)])
+        return [self.events[e] for e in detected.tolist()]
 
     def getLivingEvents(self):
-        """Return list of living events"""
-        livers = []
-        for event in self.events:
-            if not event.markedForDeath:
-                livers.append(event)
-        return livers
+        """Return a read-only view of the living events"""
+        return LivingEvents(self)
 
     def getDeadEvents(self):
-        """Return list of dead events"""
-        corpses = []
-        for event in self.events:
-            if event.markedForDeath:
-                corpses.append(event)
-        return corpses
+        """Return a read-only view of the dead events, in the order they died"""
+        return DeadEvents(self)
 
     def resetSurvey(self):
         """Clear events and reset time"""
-        self.events = []
-        self.frameEvents = []
+        self.events = SurveyEvents(self)
+        self.liveObjects = []
+        self.liveObjectIds = []
+        self.retired = []
+        self.deaths = ExpirationWheel()
+        self.idBase = self.random.ids.integers(2**64, dtype=np.uint64)
+        self.store = EventStore() if self.columnar else None
+        self.eventSlots = np.zeros(0, dtype=np.int64)
+        self.frames = FrameIndex()
+        self.frameEvents = FrameEvents(self)
+        self.detections = DetectionLog()
+        self.context = EventContext(self.store, self.detections, self.random)
+        self.sharedObjects = False
+        self.invalidateDetectionCache()
         self.absoluteTime = -1
 
+    def fork(self):
+        """Return a survey that shares this survey's simulated truth
+
+        The events, their trajectories and the frame index are shared
+        copy-on-write: nothing is copied until one of the surveys
+        advances. The fork gets its own copy of the observing profile,
+        the generator, the detections, the random streams and any other
+        state kept on the survey, so either survey can be re-detected
+        with different profile args or advanced further without
+        affecting the other. Until they are reseeded, both surveys
+        draw the same random numbers.
+        """
+        clone = copy.copy(self)
+        for name, value in self.__dict__.items():
+            if name not in FORK_MANAGED:
+                setattr(clone, name, copy.deepcopy(value))
+        clone.gen = clone.generator.generate
+        clone.profile = copy.copy(self.profile)
+        for args in ("vArgs", "oArgs", "hArgs", "sArgs"):
+            setattr(clone.profile, args,
+                    copy.deepcopy(getattr(self.profile, args)))
+
+        clone.events = self.events.fork(clone)
+        clone.liveObjects = list(self.liveObjects)
+        clone.liveObjectIds = list(self.liveObjectIds)
+        clone.retired = list(self.retired)
+        clone.deaths = self.deaths.fork()
+        clone.eventSlots = self.eventSlots.copy()
+        if self.store is not None:
+            clone.store = self.store.fork()
+        clone.frames = self.frames.fork()
+        clone.frameEvents = FrameEvents(clone)
+        clone.detections = self.detections.copy()
+        clone.stageCache = list(self.stageCache)
+
+        #The clone reads its events through a context of its own. The
+        #   living events outside the store are bound to it now, the
+        #   others as they are asked for (see SurveyEvents)
+        clone.context = EventContext(clone.store, clone.detections,
+                                     clone.random)
+        clone.liveObjects = [event.bind(clone.context)
+                             for event in self.liveObjects]
+        for event, eventId in zip(clone.liveObjects, clone.liveObjectIds):
+            clone.events[eventId] = event
+
+        #Living events outside the store are changed by advancing,
+        #   so both surveys copy them before they next advance
+        self.sharedObjects = True
+        clone.sharedObjects = True
+        return clone
+
+    def snapshot(self):
+        """Return a fork to keep as a restore point
+
+        Leave the snapshot alone and fork it whenever a fresh copy of
+        this moment of the survey is needed.
+        """
+        return self.fork()
+
     def reDetectEvents(self):
-        """Run detection again on all events"""
+        """Run detection again on all events
 
-        #Clear the past profile's detections
-        for event in self.events:
-            event.clearDetectionHistory()
-        
-        #Perform frameDetection on entire survey history
-        for i in range(self.absoluteTime):
-            self.profile.frameDetect(i, self.frameEvents[i], self)
+        Only the detection stages whose function or args changed since
+        a frame was last detected, and the stages after them, are run
+        again. If only the holistic detection changed, the frames are
+        not visited at all.
+        """
+        keys = self.currentStageKeys()
+        reuse = [self.reusableStages(i, keys)
+                 for i in range(len(self.frames))]
+
+        if any(stages is not None for stages in reuse):
+            #Clear the past profile's detections
+            self.detections.clear()
+
+            #Perform frameDetection on entire survey history.
+            #Frames that are still valid are re-recorded from the cache
+            for i in range(len(self.frames)):
+                if reuse[i] is None:
+                    self.detectFrame(i, self.stageCache[i][1])
+                else:
+                    self.detectFrame(i, reuse[i])
+        else:
+            self.detections.clearHolistic()
 
         #Mark Holistically detected events
         self.profile.holisticDetect(self.events, self)
@@ -123,7 +663,7 @@ class TransientSurvey:
 
     def setGeneratorFunctionArgs(self, args):
         """Set the Generator Functions' arguments"""
-        self.generator.eargs = args
+        self.generator.eArgs = args
     
     def setObservingProfileArgs(self, vArgs, oArgs, hArgs, sArgs):
         """Re detect events after changing ObservingProfile's extra args
@@ -147,20 +687,46 @@ class TransientSurvey:
         #Re run detection
         self.reDetectEvents()
 
-    def reRunSurvey(self, time=None):
+    def reRunSurvey(self, time=None, seed=None):
         """Reset the survey and rerun
         
         Args:
             time:
                 number of time-steps to rerun for
+            seed:
+                If given, every stream of self.random is reseeded with
+                    it first, so reruns with the same seed (and args)
+                    produce the same data. Otherwise the streams carry
+                    on and the rerun produces new data
         """
         if time is None:
             time = self.absoluteTime
+        if seed is not None:
+            self.random.reseed(seed)
         self.resetSurvey()
 
         for _ in range(time):
             self.advance()
-        self.profile.holisticDetect(self.events, self)
+        self.holisticDetectEvents()
+
+    def extendSurvey(self, time):
+        """Carry on the current run until it has lasted time time-steps
+
+        The simulation is continued, not restarted, so a survey rerun
+        for a short time and then extended has the same events as one
+        rerun for the whole time with the same seed.
+
+        Args:
+            time:
+                Total number of time-steps of the run. Runs that are
+                    already this long are left as they are
+        """
+        steps = time - (self.absoluteTime + 1)
+        if steps <= 0:
+            return
+        for _ in range(steps):
+            self.advance()
+        self.holisticDetectEvents()
 
     def getMeasurementData(self):
         return self.profile.measureFunc(self.events, self)
\ No newline at end of file
@@ -4,6 +4,8 @@ Library of functions used for testing the stuff
 
 import numpy as np
 from src.makedata.TransientEvent import TransientEvent
+from src.makedata.SpawnBatch import SpawnBatch
+from src.makedata.RandomStreams import takesRNG
 
 
 trans = TransientEvent
@@ -35,11 +37,12 @@ def rectangleView(time, events, size, corner):
                         passedEvents.append(event)
     return passedEvents
 
-def randomObstruction(time, events, obstructProbability):
+def randomObstruction(time, events, surv, obstructProbability):
     """Return passFraction of events at random"""
+    rng = surv.random.obstruction
     passedEvents = []
     for event in events:
-        if np.random.rand() > obstructProbability:
+        if rng.random() > obstructProbability:
             passedEvents.append(event)
     return passedEvents
 
@@ -50,37 +53,53 @@ def oneFrameDetectHolistic(event):
     else:
         return False
 
-def gaussSurveyNoise(event, mean, std):
-    return np.random.normal(mean, std)
+def gaussSurveyNoise(event, surv, mean, std):
+    return surv.random.detectorNoise.normal(mean, std)
 
-def gaussEventNoise(mean, std):
-    return np.random.normal(mean, std)
+@takesRNG
+def gaussEventNoise(lum, loc, lifetime, mean, std, rng=None):
+    return rng.normal(mean, std)
 
 def bugSurveyNoise(event):
     return 0
 
-def genEventsUniform(frame, shape, prob):
+def genEventsUniform(frame, shape, surv, prob):
     """Generate events with uniform prob over the region
     
     Events have a lifetime of 20 frame with std dev of 5
     events have no luminosity noise and always output at 1
     """
+    rng = surv.random.generation
     boxes = shape[0]*shape[1]
-    numEvents = np.random.binomial(boxes, prob)
+    numEvents = rng.binomial(boxes, prob)
     newEvents = []
     for _ in range(numEvents):
-        birth = (np.random.randint(0,shape[0]),
-                 np.random.randint(0,shape[1]))
+        birth = (rng.integers(0,shape[0]),
+                 rng.integers(0,shape[1]))
         birthloc = [frame, birth[0], birth[1], 0, 0]
-        life = np.random.normal(20,5)
-        event = trans(birthloc, life, 5)
+        life = rng.normal(20,5)
+        event = trans(birthloc, life, 5, rng=surv.random.eventNoise)
         newEvents.append(event)
     return newEvents
 
-def getPointInRing(minRad, maxRad):
-    """Return a point in the ring from minRad to maxRad inclusive"""
-    length = np.sqrt(np.random.uniform(minRad**2, maxRad**2))
-    angle = np.pi*np.random.uniform(0,2)
+def genEventsUniformBatch(frame, shape, surv, prob):
+    """genEventsUniform, spawning all of the frame's events as one batch"""
+    rng = surv.random.generation
+    numEvents = rng.binomial(shape[0]*shape[1], prob)
+    birthLocs = np.zeros((numEvents, 5))
+    birthLocs[:, 0] = frame
+    birthLocs[:, 1] = rng.integers(0, shape[0], numEvents)
+    birthLocs[:, 2] = rng.integers(0, shape[1], numEvents)
+    lifetimes = rng.normal(20, 5, numEvents)
+    return SpawnBatch(birthLocs, lifetimes, 5)
+
+def getPointInRing(minRad, maxRad, rng):
+    """Return a point in the ring from minRad to maxRad inclusive
+
+    rng is the np.random.Generator to draw the point from
+    """
+    length = np.sqrt(rng.uniform(minRad**2, maxRad**2))
+    angle = np.pi*rng.uniform(0,2)
     x = length * np.cos(angle)
     y = length * np.sin(angle)
     return [x,y]
@@ -129,11 +148,13 @@ def genLightBugs(frame, shape, surv, bugStart0, bugStart1, bugStart2,
     newEvents = []
     for i in range(len(surv.bug)):
         for _ in range(round(surv.bug[i])):
-            loc = getPointInRing(round(i*radius/3),round((i+1)*radius/3))
+            loc = getPointInRing(round(i*radius/3),round((i+1)*radius/3),
+                                 surv.random.generation)
             loc[0] += radius    #move the center of the circle to the
             loc[1] += radius    #middle of the survey
             birth = [frame, loc[0], loc[1], 0, 0]
-            newEvent = TransientEvent(birth, lifetime = 1, classID = i) 
+            newEvent = TransientEvent(birth, lifetime = 1, classID = i,
+                                      rng = surv.random.eventNoise)
             newEvents.append(newEvent)
 
     return newEvents
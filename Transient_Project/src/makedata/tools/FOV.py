@@ -8,54 +8,117 @@ Apply Field of Vision to true data
 __author__ = "T Faridani"
 
 import numpy as np
-import math
+import functools
 import astropy.nddata as nd
 
-def write_circle_fov(dattype, data, radius, loc, output_filename):
-    """Apply a circle fov and write a fits image"""
-    shape = data.shape
-    final = np.zeros(shape, dtype=dattype)
-    for i in range(shape[0]):
-        for k in range(shape[1]):
-            if math.hypot(i-loc[0], k-loc[1]) <= radius:
-                final[(i,k)] = data[(i,k)]
-    
-    #this is really inefficient, but it's at least consistent
+#Number of masks kept by fov_mask. A 4k x 4k mask takes 16 MB
+MASK_CACHE_SIZE = 8
+
+def _build_mask(shape, geometry, loc):
+    """Return a boolean mask of the pixels inside a fov
+
+    See fov_mask for the arguments
+    """
+    kind = geometry[0]
+    i, k = np.ogrid[:shape[0], :shape[1]]
+    if kind == "circle":
+        radius = geometry[1]
+        return np.hypot(i - loc[0], k - loc[1]) <= radius
+    elif kind == "square":
+        radius = geometry[1]
+        return ((i >= loc[0] - radius) & (i < loc[0] + radius)
+                & (k >= loc[1] - radius) & (k < loc[1] + radius))
+    elif kind == "rectangle":
+        down, right = geometry[1], geometry[2]
+        return ((i >= loc[0]) & (i - loc[0] <= down)
+                & (k >= loc[1]) & (k - loc[1] <= right))
+    raise ValueError("Unknown fov geometry " + repr(kind)
+                     + ". Choose from circle, square, rectangle")
+
+@functools.lru_cache(maxsize=MASK_CACHE_SIZE)
+def _cached_mask(shape, geometry, loc):
+    mask = _build_mask(shape, geometry, loc)
+    #Cached masks are shared by every caller
+    mask.setflags(write=False)
+    return mask
+
+def fov_mask(shape, geometry, loc):
+    """Return a read-only boolean mask, True inside the fov
+
+    Masks are built with broadcasting and kept in an LRU cache of
+    MASK_CACHE_SIZE masks, so repeated pointings reuse them.
+
+    Arguments:
+    shape:
+        shape of the image. Only the last two axes are used
+    geometry:
+        tuple. One of
+            ("circle", radius): pixels within radius of loc
+                (inclusive)
+            ("square", radius): pixels from loc-radius (inclusive)
+                to loc+radius (exclusive) on both axes
+            ("rectangle", down, right): pixels from loc (the upper
+                left corner) to loc + (down, right), inclusive
+    loc:
+        length 2 iterable. matrix location of the fov
+    """
+    shape = tuple(int(n) for n in shape[-2:])
+    geometry = (geometry[0],) + tuple(geometry[1:])
+    loc = tuple(loc[:2])
+    return _cached_mask(shape, geometry, loc)
+
+def clear_fov_cache():
+    """Forget every cached mask"""
+    _cached_mask.cache_clear()
+
+def apply_fov(imagearray, geometry, loc, out=None):
+    """Return an imagearray with all but the fov turned to black
+
+    Arguments:
+    imagearray:
+        numpy array. A single image, or a stack of images along the
+        leading axes
+    geometry, loc:
+        see fov_mask
+    out:
+        optional array to write the result to. Pass imagearray itself
+        to black out the image in place
+    """
+    mask = fov_mask(imagearray.shape, geometry, loc)
+    if out is None:
+        return np.where(mask, imagearray,
+                        np.zeros(1, dtype=imagearray.dtype))
+    np.copyto(out, imagearray, casting="unsafe")
+    out[..., ~mask] = 0
+    return out
+
+def write_fov(dattype, data, geometry, loc, output_filename):
+    """Apply a fov and write a fits image
+
+    output_filename gets '.fits' added automatically
+
+    Writes one file per call. To write many frames, stream them into
+    one file with fitsstream.FITSCubeWriter
+    """
+    final = apply_fov(data, geometry, loc).astype(dattype, copy=False)
     wrap = nd.CCDData(final, unit='adu')
     wrap.write(output_filename + ".fits")
 
+def write_circle_fov(dattype, data, radius, loc, output_filename):
+    """Apply a circle fov and write a fits image"""
+    write_fov(dattype, data, ("circle", radius), loc, output_filename)
+
 def apply_circle_fov(imagearray, radius, loc):
     """Return an imagearray with all but a circle turned to black
     
     imagearray must be a numpy array"""
-    shape = imagearray.shape
-    final = np.zeros(shape, dtype=imagearray.dtype)
-    loweri = max(0,loc[0]-radius)
-    upperi = min(shape[0],loc[0]+radius)
-    lowerk = max(0,loc[1]-radius)
-    upperk = min(shape[1],loc[1]+radius)
-    
-    for i in range(loweri, upperi):
-        for k in range(lowerk, upperk):
-            if math.hypot(i-loc[0], k-loc[1]) <= radius:
-                final[i][k] = imagearray[i][k]
-    return final
+    return apply_fov(imagearray, ("circle", radius), loc)
 
 def apply_square_fov(imagearray, radius, loc):
     """Return an imagearray with all but a square turned to black
     
     imagearray must be a numpy array"""
-    shape = imagearray.shape
-    final = np.zeros(shape, dtype=imagearray.dtype)
-    lowi = max(0,loc[0]-radius)
-    upi = min(shape[0],loc[0]+radius)
-    lowk = max(0,loc[1]-radius)
-    upk = min(shape[1],loc[1]+radius)
-
-    final[lowi:upi,lowk:upk] = imagearray[lowi:upi,lowk:upk]
-
-
-    return final
+    return apply_fov(imagearray, ("square", radius), loc)
 
 
 def write_rectagle_fov(dattype, data, rect, ulc, output_filename):
@@ -80,57 +143,160 @@ def write_rectagle_fov(dattype, data, rect, ulc, output_filename):
         filename to write to. the '.fits' is added automatically
     """
     #ulc stands for upper left corner
-    shape = data.shape
-    final = np.zeros(shape, dtype=dattype)
-    for i in range(shape[0]):
-        for k in range(shape[1]):
-            if ((i - ulc[0]) <= rect[0] and (k - ulc[1]) <= rect[1]):
-                final[(i,k)] = data[(i,k)]
-            
-    #this is really inefficient, but it's at least consistent
-    wrap = nd.CCDData(final, unit='adu')
-    wrap.write(output_filename + ".fits")
+    write_fov(dattype, data, ("rectangle", rect[0], rect[1]), ulc,
+              output_filename)
     
-def apply_dynamic_random_scatter(dattype, data, covered_fraction):
-    """cover a random fraction of the data"""
-    if covered_fraction < 0  or covered_fraction > 1:
-        raise ValueError("covered_fraction is not between 0 and 1")
-    shape = data.shape
-    final = np.zeros(shape, dtype=dattype)
-    for i in range(len(final)):
-        for k in range(len(final[i])):
-            if np.random.rand() > covered_fraction:
-                final[i][k] = data[i][k]
-    return final
-
-def make_static_cover(shape, covered_fraction):
-    """make a list of random indeces to cover"""
+class PackedCover:
+    """Covered pixels of an image, or of every frame of a frame cube
+
+    The cover is kept as packed bits (np.packbits), one bit per pixel,
+    one row of bytes per frame. Iterating over a single-frame cover
+    gives the (i, k) tuples of the covered pixels, as the lists of
+    make_static_cover used to.
+
+    Arguments:
+    mask:
+        boolean array, True where covered. 2-D for one image, 3-D
+        (frames, rows, columns) for a frame cube
+    """
+    def __init__(self, mask):
+        mask = np.asarray(mask, dtype=bool)
+        if mask.ndim not in (2, 3):
+            raise ValueError("a cover must be 2-D or 3-D")
+        self.shape = mask.shape
+        self.frame_shape = mask.shape[-2:]
+        frames = mask.reshape(-1, self.frame_shape[0]*self.frame_shape[1])
+        self.bits = np.packbits(frames, axis=1)
+
+    def __len__(self):
+        """Number of covered pixels"""
+        return int(np.unpackbits(self.bits, axis=1,
+                                 count=self.pixels()).sum())
+
+    def __contains__(self, index):
+        i, k = index
+        return bool(self.frame_mask(0)[i, k])
+
+    def __iter__(self):
+        if len(self.shape) != 2:
+            raise TypeError("only single-frame covers list their pixels")
+        i, k = np.nonzero(self.frame_mask(0))
+        return iter(zip(i.tolist(), k.tolist()))
+
+    def __or__(self, other):
+        """Return the union of two covers of the same shape"""
+        if self.shape != other.shape:
+            raise ValueError("covers have different shapes")
+        union = PackedCover.__new__(PackedCover)
+        union.shape = self.shape
+        union.frame_shape = self.frame_shape
+        union.bits = self.bits | other.bits
+        return union
+
+    def pixels(self):
+        """Number of pixels in one frame"""
+        return self.frame_shape[0]*self.frame_shape[1]
+
+    def frames(self):
+        """Number of frames in the cover"""
+        return len(self.bits)
+
+    def frame_mask(self, frame):
+        """Return the boolean mask of one frame, True where covered"""
+        return np.unpackbits(self.bits[frame],
+                             count=self.pixels()).view(bool).reshape(
+                                                        self.frame_shape)
+
+    def mask(self):
+        """Return the whole cover as a boolean array"""
+        return np.unpackbits(self.bits, axis=1,
+                             count=self.pixels()).view(bool).reshape(
+                                                        self.shape)
+
+    def apply(self, data, out=None):
+        """Return data with the covered pixels turned to black
+
+        A single-frame cover is applied to every frame of a stack.
+        A frame cube is applied frame by frame to data of its shape,
+        so only one frame is ever unpacked.
+
+        Arguments:
+        data:
+            numpy array. An image or a stack of images
+        out:
+            optional array to write the result to. Pass data itself
+            to cover it in place
+        """
+        if out is None:
+            out = np.empty_like(data)
+        if len(self.shape) == 2:
+            np.copyto(out, data)
+            out[..., self.frame_mask(0)] = 0
+            return out
+        if data.shape != self.shape:
+            raise ValueError("data does not have the shape of the cover")
+        for frame in range(self.frames()):
+            np.copyto(out[frame], data[frame])
+            out[frame][self.frame_mask(frame)] = 0
+        return out
+
+def _check_fraction(covered_fraction):
     if covered_fraction < 0  or covered_fraction > 1:
         raise ValueError("fraction is not between 0 and 1")
-    badlist = []
-    stupid = np.zeros(shape, dtype=np.uint8)
-    for i in range(len(stupid)):
-        for k in range(len(stupid[i])):
-            if np.random.rand() < covered_fraction:
-                badlist.append((i,k))
-    return badlist
+
+def make_random_cover(shape, covered_fraction, rng=None):
+    """Return a PackedCover of a random fraction of the pixels
+
+    Arguments:
+    shape:
+        shape of the image, or (frames, rows, columns) for a frame
+        cube with a new cover in every frame
+    covered_fraction:
+        probability that each pixel is covered
+    rng:
+        np.random.Generator, or a seed for one. None seeds from the OS
+    """
+    _check_fraction(covered_fraction)
+    rng = np.random.default_rng(rng)
+    return PackedCover(rng.random(shape) < covered_fraction)
+
+def stack_covers(covers):
+    """Return a frame cube cover made of single-frame covers, in order"""
+    if len({cover.frame_shape for cover in covers}) != 1:
+        raise ValueError("covers have different shapes")
+    cube = PackedCover.__new__(PackedCover)
+    cube.frame_shape = covers[0].frame_shape
+    cube.bits = np.concatenate([cover.bits for cover in covers])
+    cube.shape = (len(cube.bits),) + cube.frame_shape
+    return cube
+
+def apply_dynamic_random_scatter(dattype, data, covered_fraction, rng=None):
+    """cover a random fraction of the data"""
+    _check_fraction(covered_fraction)
+    rng = np.random.default_rng(rng)
+    keep = rng.random(data.shape) > covered_fraction
+    return np.where(keep, data, 0).astype(dattype)
+
+def make_static_cover(shape, covered_fraction, rng=None):
+    """Return a PackedCover of random indeces to cover
+
+    Iterate over it for the covered (i, k) indeces"""
+    return make_random_cover(shape, covered_fraction, rng)
 
 def apply_static_random_scatter(data, cover):
-    """Darken the listed indeces"""
-    final = np.zeros(data.shape, data.dtype)
-    for i in range(data):
-        for k in range(data[i]):
-            if (i,k) not in cover:
-                final[i][k] = data[i][k]
-    return final
+    """Darken the covered indeces
+
+    cover is a PackedCover, or an iterable of (i, k) indeces"""
+    if not isinstance(cover, PackedCover):
+        mask = np.zeros(data.shape[-2:], dtype=bool)
+        indices = np.array(list(cover), dtype=np.int64).reshape(-1, 2)
+        mask[indices[:, 0], indices[:, 1]] = True
+        cover = PackedCover(mask)
+    return cover.apply(data)
     
-def apply_dynamic_img_scatter(data, covered_fraction):
+def apply_dynamic_img_scatter(data, covered_fraction, rng=None):
     """Pick a fraction of points at random and darken them"""
-    final = np.zeros(data.shape, data.dtype)
-    if covered_fraction < 0  or covered_fraction > 1:
-        raise ValueError("fraction is not between 0 and 1")    
-    for i in range(len(data)):
-        for k in range(len(data[i])):
-            if np.random.rand() > covered_fraction:
-                final[i][k] = data[i][k]
-    return data
\ No newline at end of file
+    _check_fraction(covered_fraction)
+    rng = np.random.default_rng(rng)
+    keep = rng.random(data.shape) > covered_fraction
+    return np.where(keep, data, np.zeros(1, dtype=data.dtype))
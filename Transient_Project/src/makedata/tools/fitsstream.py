@@ -0,0 +1,206 @@
+"""
+Stream masked frames into a single FITS file
+
+write_circle_fov and write_rectagle_fov write one FITS file per image
+through CCDData. FITSCubeWriter instead appends frames, masked with the
+same fovs, to one cube or multi-extension file in chunks, so long
+surveys (e.g. SurveyRenderer cubes) can be written with memory bounded
+by one chunk.
+"""
+
+import numpy as np
+import astropy.io.fits as fits
+from .FOV import apply_fov
+
+#FITS BITPIX of the numpy dtypes that FITS stores without scaling
+BITPIX = {np.dtype(np.uint8): 8, np.dtype(np.int16): 16,
+          np.dtype(np.int32): 32, np.dtype(np.int64): 64,
+          np.dtype(np.float32): -32, np.dtype(np.float64): -64}
+
+#FITS files are written in blocks of this many bytes
+BLOCK = 2880
+
+class FITSCubeWriter:
+    """Write frames to one FITS file, a chunk of frames at a time
+
+    Frames are masked into a buffer of chunk_frames frames as they are
+    written, and every full buffer goes to disk as raw big-endian
+    bytes. Memory use is bounded by one chunk, whatever the number of
+    frames, and astropy is only used to format the headers.
+
+    Two layouts are supported:
+        cube (extensions=False): one 3-D primary image, (frames, rows,
+            columns) in numpy order. Its NAXIS3 is filled in by close
+        extensions (extensions=True): an empty primary HDU followed by
+            one 3-D image extension per chunk, each with its own
+            pointing (loc) in its header
+
+    The mask and pointing go in the headers:
+        FOVTYPE, FOVPAR1..: the fov geometry (see FOV.fov_mask)
+        FOVLOCI, FOVLOCK: the pointing (loc) of the fov
+        COVERED: number of pixels darkened by the cover
+        plus any extra cards passed in
+
+    Arguments:
+    filename:
+        file to write. Overwritten
+    frame_shape:
+        (rows, columns) of every frame
+    dtype:
+        numpy dtype to store. One of the keys of BITPIX
+    geometry, loc:
+        optional fov applied to every frame (see FOV.fov_mask)
+    cover:
+        optional single-frame FOV.PackedCover applied to every frame
+    cards:
+        optional dict of extra header cards, e.g. the telescope
+        pointing on the sky
+    extensions:
+        bool. see above
+    chunk_frames:
+        number of frames buffered before they are written
+    """
+    def __init__(self, filename, frame_shape, dtype=np.float32,
+                 geometry=None, loc=None, cover=None, cards=None,
+                 extensions=False, chunk_frames=16):
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in BITPIX:
+            raise ValueError("FITS cannot store " + str(self.dtype)
+                             + " without scaling")
+        if geometry is not None and loc is None:
+            raise ValueError("a fov geometry needs a loc")
+        self.frame_shape = tuple(int(n) for n in frame_shape)
+        self.geometry = geometry
+        self.loc = loc
+        self.cover = cover
+        self.cards = dict(cards or {})
+        self.extensions = extensions
+
+        self.buffer = np.zeros((chunk_frames,) + self.frame_shape,
+                               dtype=self.dtype.newbyteorder(">"))
+        self.buffered = 0
+        self.frames = 0
+        self.data_bytes = 0
+
+        self.file = open(filename, "wb")
+        if self.extensions:
+            primary = fits.Header()
+            primary["SIMPLE"] = True
+            primary["BITPIX"] = 8
+            primary["NAXIS"] = 0
+            primary["EXTEND"] = True
+            self._add_cards(primary, self.loc)
+            self.file.write(primary.tostring().encode("ascii"))
+        else:
+            #Written again by close, once the number of frames is known
+            self.file.write(self._header(0, self.loc))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add_cards(self, header, loc):
+        """Add the mask and pointing cards to header"""
+        if self.geometry is not None:
+            header["FOVTYPE"] = (self.geometry[0], "fov geometry")
+            for n, value in enumerate(self.geometry[1:]):
+                header["FOVPAR" + str(n + 1)] = value
+            header["FOVLOCI"] = (loc[0], "fov pointing, first axis")
+            header["FOVLOCK"] = (loc[1], "fov pointing, second axis")
+        if self.cover is not None:
+            header["COVERED"] = (len(self.cover), "pixels darkened by cover")
+        for key, value in self.cards.items():
+            header[key] = value
+
+    def _header(self, frames, loc, extension=False):
+        """Return the header bytes of an image of frames frames"""
+        header = fits.Header()
+        if extension:
+            header["XTENSION"] = "IMAGE"
+        else:
+            header["SIMPLE"] = True
+        header["BITPIX"] = BITPIX[self.dtype]
+        header["NAXIS"] = 3
+        header["NAXIS1"] = self.frame_shape[1]
+        header["NAXIS2"] = self.frame_shape[0]
+        header["NAXIS3"] = frames
+        if extension:
+            header["PCOUNT"] = 0
+            header["GCOUNT"] = 1
+        else:
+            header["EXTEND"] = True
+        self._add_cards(header, loc)
+        return header.tostring().encode("ascii")
+
+    def write(self, frames, loc=None):
+        """Mask frames and add them to the file
+
+        Arguments:
+        frames:
+            one (rows, columns) frame, or a stack of them
+        loc:
+            pointing of the fov for these frames. Defaults to the loc
+            given to the writer. Only extension files can change it;
+            the buffered frames are then written out first, so each
+            extension has a single pointing
+        """
+        frames = np.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[None]
+        if frames.shape[1:] != self.frame_shape:
+            raise ValueError("frames do not have the shape of the file")
+        if loc is not None and (self.loc is None
+                                or not np.array_equal(loc, self.loc)):
+            if not self.extensions:
+                raise ValueError("the pointing of a cube cannot change")
+            self.flush()
+            self.loc = loc
+
+        start = 0
+        while start < len(frames):
+            count = min(len(frames) - start, len(self.buffer) - self.buffered)
+            target = self.buffer[self.buffered:self.buffered + count]
+            chunk = frames[start:start + count]
+            if self.geometry is not None:
+                chunk = apply_fov(chunk, self.geometry, self.loc)
+            if self.cover is not None:
+                chunk = self.cover.apply(chunk)
+            target[...] = chunk
+            self.buffered += count
+            start += count
+            if self.buffered == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        """Write the buffered frames to the file"""
+        if self.buffered == 0:
+            return
+        data = self.buffer[:self.buffered]
+        if self.extensions:
+            self.file.write(self._header(self.buffered, self.loc,
+                                         extension=True))
+            self.file.write(data.tobytes())
+            self._pad(data.nbytes)
+        else:
+            self.file.write(data.tobytes())
+            self.data_bytes += data.nbytes
+        self.frames += self.buffered
+        self.buffered = 0
+
+    def _pad(self, nbytes):
+        """Pad data of nbytes bytes to a whole number of FITS blocks"""
+        self.file.write(b"\0"*(-nbytes % BLOCK))
+
+    def close(self):
+        """Write out the last frames and finish the file"""
+        if self.file.closed:
+            return
+        self.flush()
+        if not self.extensions:
+            self._pad(self.data_bytes)
+            #The header has the same number of cards, so the same length
+            self.file.seek(0)
+            self.file.write(self._header(self.frames, self.loc))
+        self.file.close()
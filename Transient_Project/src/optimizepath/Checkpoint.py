@@ -0,0 +1,39 @@
+"""
+Checkpoints of optimizer state
+
+TransientGenetic and TransientSPSA can write their state to disk as
+they run, so that a run that is stopped can be resumed with their
+resume method. Only the optimizer's own state is written (a dict of
+small arrays, lists and random generator states), never the survey or
+the black box, which the caller rebuilds the same way as for the
+first run. A checkpoint is written to a temporary file and then moved
+over the old one, so a crash while writing leaves the previous
+checkpoint in place.
+"""
+
+import os
+import pickle
+
+def saveCheckpoint(path, state):
+    """Write the dict state to path, replacing any older checkpoint"""
+    path = os.fspath(path)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+def loadCheckpoint(path):
+    """Return the state dict written to path by saveCheckpoint"""
+    with open(os.fspath(path), "rb") as f:
+        return pickle.load(f)
+
+def surveyRandomState(survey):
+    """Return the state of survey's random streams, or None without a survey"""
+    if survey is None or not hasattr(survey, "random"):
+        return None
+    return survey.random.state()
+
+def setSurveyRandomState(survey, state):
+    """Restore the streams of survey to a state from surveyRandomState"""
+    if state is not None:
+        survey.random.setState(state)
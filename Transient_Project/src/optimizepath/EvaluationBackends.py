@@ -0,0 +1,172 @@
+"""
+Ways for TransientBlackBox.returnValues to evaluate many parameter vectors
+
+Every backend has an evaluate method
+    evaluate(blackBox, matrix, seeds)
+that returns the loss of blackBox at every row of matrix, in order.
+seeds holds the simulation seed of every row (None entries carry on
+the survey's random streams). The thread and process backends run
+rows on copies of the black box, which all start from the same random
+state, so they give every row that would carry on the streams a fresh
+seed of its own (see freshSeeds). Backends are chosen by name from
+BACKENDS or passed in as objects.
+    serial:     One row after another on the black box itself
+    thread:     Rows spread over threads, each with its own deep copy
+                    of the black box
+    process:    Rows spread over worker processes, each with its own
+                    unpickled copy of the black box
+    lockstep:   Rows that share their generator args and seed share
+                    one simulation of the truth. Each row is then only
+                    re-detected, on a fork of that simulation
+"""
+
+import copy
+import pickle
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+#The black box of a worker process, set by _initWorker
+_workerBlackBox = None
+
+def _initWorker(blackBoxBytes):
+    global _workerBlackBox
+    _workerBlackBox = pickle.loads(blackBoxBytes)
+
+def _evaluateInWorker(scaledVec, seed):
+    return _workerBlackBox.returnValue(scaledVec, seed)
+
+def freshSeeds(blackBox, seeds):
+    """Return seeds with a new seed for every row that has none
+
+    Rows without a seed (and a black box without a default seed) would
+    carry on the random streams of whichever copy of the black box they
+    run on, so they would share noise, and which rows share it would
+    depend on the scheduling. The new seeds are drawn from the
+    generation stream of the black box's survey, so a seeded survey
+    draws the same ones.
+    """
+    if getattr(blackBox, "seed", None) is not None:
+        return list(seeds)
+    survey = getattr(blackBox, "surv", None)
+    if survey is not None and hasattr(survey, "random"):
+        rng = survey.random.generation
+    else:
+        rng = np.random.default_rng()
+    return [int(rng.integers(2**63)) if seed is None else seed
+            for seed in seeds]
+
+class SerialBackend:
+    def evaluate(self, blackBox, matrix, seeds):
+        return [blackBox.returnValue(vec, seed)
+                for vec, seed in zip(matrix, seeds)]
+
+class ThreadBackend:
+    """
+    Args:
+        workers:
+            Number of threads. None lets ThreadPoolExecutor choose
+    """
+    def __init__(self, workers=None):
+        self.workers = workers
+
+    def evaluate(self, blackBox, matrix, seeds):
+        #The surveys are changed by every evaluation, so each thread
+        #   works on a copy of its own
+        local = threading.local()
+
+        def evaluateRow(vec, seed):
+            if not hasattr(local, "blackBox"):
+                local.blackBox = copy.deepcopy(blackBox)
+            return local.blackBox.returnValue(vec, seed)
+
+        seeds = freshSeeds(blackBox, seeds)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(evaluateRow, matrix, seeds))
+
+class ProcessBackend:
+    """
+    The worker processes are started on the first evaluate and kept
+    until close, or until a different black box is evaluated. They keep
+    the copy of the black box they were started with, so call close
+    after changing the black box other than through its vector.
+
+    Args:
+        workers:
+            Number of processes. None uses every core
+    """
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.pool = None
+        self.blackBox = None
+
+    def __getstate__(self):
+        #Copies of the backend (e.g. inside a pickled black box) start
+        #   their own workers
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["blackBox"] = None
+        return state
+
+    def evaluate(self, blackBox, matrix, seeds):
+        if self.pool is None or self.blackBox is not blackBox:
+            self.close()
+            self.pool = ProcessPoolExecutor(
+                                max_workers=self.workers,
+                                initializer=_initWorker,
+                                initargs=(pickle.dumps(blackBox),))
+            self.blackBox = blackBox
+        seeds = freshSeeds(blackBox, seeds)
+        return list(self.pool.map(_evaluateInWorker, matrix, seeds))
+
+    def close(self):
+        """Shut down the worker processes, if any"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.blackBox = None
+
+class LockstepBackend:
+    """Simulate the truth once for every distinct (generator args, seed)
+
+    Detection is re-run on a fork of the simulation for every row,
+    which only recomputes the detection stages whose args differ.
+    When seeds are given, the detector noise and obstruction streams
+    are reseeded before every re-detection, so the losses are the same
+    as those of SerialBackend.
+    """
+    def evaluate(self, blackBox, matrix, seeds):
+        groups = {}
+        for row, (vec, seed) in enumerate(zip(matrix, seeds)):
+            genArgs = blackBox.splitScaledVec(vec)[4]
+            key = (tuple(tuple(args) for args in genArgs), seed)
+            groups.setdefault(key, []).append(row)
+
+        losses = [None]*len(matrix)
+        survey = blackBox.surv
+        for (_, seed), rows in groups.items():
+            blackBox.applyNewParams(matrix[rows[0]], redetect=False)
+            survey.reRunSurvey(blackBox.runTime, seed)
+            base = survey.snapshot()
+            for row in rows:
+                clone = base.fork()
+                if seed is not None:
+                    clone.random.reseed(seed, ("detectorNoise", "obstruction"))
+                clone.setObservingProfileArgs(
+                                *blackBox.splitScaledVec(matrix[row])[:4])
+                losses[row] = blackBox.loss(clone, blackBox.comparisonData)
+        return losses
+
+BACKENDS = {"serial": SerialBackend,
+            "thread": ThreadBackend,
+            "process": ProcessBackend,
+            "lockstep": LockstepBackend}
+
+def makeBackend(backend):
+    """Return a backend object from a name in BACKENDS or a backend"""
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend " + repr(backend)
+                             + ". Choose from " + ", ".join(BACKENDS))
+        return BACKENDS[backend]()
+    return backend
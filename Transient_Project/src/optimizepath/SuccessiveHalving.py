@@ -0,0 +1,94 @@
+"""
+Successive halving: score many candidates on short surveys, and only
+the most promising ones on long surveys
+
+All candidates are first scored on a survey a fraction of the full
+length. The best 1/eta of them are promoted to a survey eta times
+longer, and so on, until the last ones left are scored on the full
+length. With n candidates and rungs rungs, each rung scores about
+n*surveyTime/eta**(rungs-1) frames in total, instead of n*surveyTime.
+"""
+
+import numpy as np
+
+def rungTimes(surveyTime, rungs, eta):
+    """Return the survey length of every rung, shortest first
+
+    The last rung is always surveyTime. No rung is shorter than 1
+    """
+    return [max(1, int(round(surveyTime/eta**(rungs - 1 - k))))
+            for k in range(rungs)]
+
+def successiveHalving(count, scoreAt, times, eta):
+    """Score count candidates by successive halving
+
+    Candidates dropped at a rung keep the score they had there, carried
+    up to the full length by the mean change in score of the promoted
+    candidates on the rungs above, so that scores from different rungs
+    are on about the same scale. Dropped candidates always score below
+    every candidate promoted past their rung, in the order of their
+    score on that rung.
+
+    Args:
+        count:
+            Number of candidates
+        scoreAt:
+            Function
+                Args:
+                    indices:
+                        List of the candidates to score
+                    time:
+                        Survey length to score them on
+                Returns:
+                    List of the scores of the candidates, in order.
+                    Higher => better
+        times:
+            Survey length of every rung, as from rungTimes
+        eta:
+            Only the best 1/eta of the candidates of a rung are
+                promoted to the next
+
+    Returns:
+        scores:
+            Length count float array. The score of every candidate
+        frames:
+            Total number of survey frames that were scored
+    """
+    scores = np.zeros(count)
+    frames = 0
+    alive = np.arange(count)
+    rungs = []
+    for k, time in enumerate(times):
+        rungScores = np.asarray(scoreAt(alive.tolist(), time), dtype=float)
+        frames += len(alive)*time
+        rungs.append((alive, rungScores))
+        if k == len(times) - 1:
+            break
+
+        #Stable sort so that ties are promoted in candidate order
+        order = np.argsort(-rungScores, kind="stable")
+        alive = alive[order[:max(1, int(np.ceil(len(alive)/eta)))]]
+
+    #Fill in the scores from the longest rung down. The scores of every
+    #   rung are carried up by the mean change in score of the promoted
+    #   candidates between the rungs above it, then lowered where
+    #   needed so that no dropped candidate outscores a promoted one
+    offset = 0.0
+    floor = np.inf
+    for k in reversed(range(len(rungs))):
+        candidates, rungScores = rungs[k]
+        if k < len(rungs) - 1:
+            promoted = np.isin(candidates, rungs[k + 1][0])
+            offset += rungs[k + 1][1].mean() - rungScores[promoted].mean()
+            candidates = candidates[~promoted]
+            rungScores = rungScores[~promoted]
+            if len(candidates) == 0:
+                continue
+            carried = rungScores + min(offset, floor - rungScores.max())
+            #Ties with the floor go to the promoted candidates
+            scores[candidates] = np.minimum(carried,
+                                            np.nextafter(floor, -np.inf))
+        else:
+            scores[candidates] = rungScores
+        floor = min(floor, scores[candidates].min())
+    return scores, frames
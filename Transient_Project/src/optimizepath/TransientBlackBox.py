@@ -8,12 +8,14 @@ Integer support will be deprecated
 """
 
 import numpy as np
+from .EvaluationBackends import makeBackend
 
 class TransientBlackBox:
     """
     as
     """
-    def __init__(self, survey, runTime, lossFunction, comparisonData):
+    def __init__(self, survey, runTime, lossFunction, comparisonData,
+                 backend="serial", seed=None):
         """
         Args:
             survey:
@@ -31,6 +33,15 @@ class TransientBlackBox:
                             The data to score against
             comparisonData:
                 The "observed in real-life data" to mimic
+            backend:
+                How returnValues evaluates many vectors. A name in
+                    EvaluationBackends.BACKENDS ("serial", "thread",
+                    "process" or "lockstep") or a backend object
+            seed:
+                Simulation seed used by returnValue when it is not
+                    given one. With a fixed seed, evaluations that only
+                    move the observing profile args reuse the simulated
+                    truth and only re-run detection
 
         """
 
@@ -38,83 +49,177 @@ class TransientBlackBox:
         self.runTime = runTime
         self.loss = lossFunction
         self.comparisonData = comparisonData
+        self.backend = makeBackend(backend)
+        self.seed = seed
+
+        #(generator args, seed, FrameIndex) of the truth in self.surv,
+        #   if it may be reused. See returnValue
+        self.truth = None
         self.rawChar = self.unpackRawCharacteristicPositionVector()
+        self.buildLayout()
+
+    def buildLayout(self):
+        """Precompute where every group of args sits in a parameter vector
+
+        self.layout holds one slice per group: the viewingField,
+        extraObstruction, holisticDetection and surveyNoise args, then
+        the args of every generator function. self.center and
+        self.halfWidth map scaled vectors to raw ones.
+        """
+        profile = self.surv.profile
+        sizes = ([len(profile.vCharBias), len(profile.oCharBias),
+                  len(profile.hCharBias), len(profile.sCharBias)]
+                 + [len(args) for args in self.surv.generator.eArgs])
+        bounds = np.cumsum([0] + sizes)
+        self.layout = [slice(bounds[i], bounds[i+1])
+                       for i in range(len(sizes))]
+        assert bounds[-1] == len(self.rawChar)
 
-    def returnValue(self, scaledVec):
+        low = np.array([char[0] for char in self.rawChar], dtype=float)
+        high = np.array([char[1] for char in self.rawChar], dtype=float)
+        self.center = (high + low)/2
+        self.halfWidth = (high - low)/2
+
+    def returnValue(self, scaledVec, seed=None):
         """Return the BlackBox function value at the given scaled position
         
         Args:
             scaledVec:
                 position vector in the [-1,1]^N nondimensional parameter space
+            seed:
+                Seed for the survey's random streams. Evaluations with
+                    the same seed share their random numbers (common
+                    random numbers), so their difference is due to
+                    scaledVec alone. Defaults to self.seed. None
+                    carries on the streams
+
+        If the seed and the generator args are the same as in the
+        last evaluation, and the survey has not been rerun since, the
+        simulated truth is reused: the detection streams are reseeded
+        and only detection is re-run. The loss is the same as that of
+        a full rerun.
         """
-        self.applyNewParams(scaledVec)
-        self.surv.reRunSurvey(self.runTime)
+        if seed is None:
+            seed = self.seed
+        vArgs, oArgs, hArgs, sArgs, genExtraArgs = self.splitScaledVec(
+                                                                scaledVec)
+        if seed is not None and self.truthMatches(genExtraArgs, seed):
+            self.surv.random.reseed(seed, ("detectorNoise", "obstruction"))
+            self.surv.setObservingProfileArgs(vArgs, oArgs, hArgs, sArgs)
+        else:
+            self.applyNewParams(scaledVec, redetect=False)
+            self.surv.reRunSurvey(self.runTime, seed)
+            self.truth = None
+            if seed is not None:
+                self.truth = (genExtraArgs, seed, self.surv.frames,
+                              len(self.surv.frames))
         return self.loss(self.surv, self.comparisonData)
 
+    def truthMatches(self, genExtraArgs, seed):
+        """Return True if the survey holds the truth for these args and seed"""
+        if self.truth is None:
+            return False
+        oldArgs, oldSeed, frames, numFrames = self.truth
+        return (oldSeed == seed
+                and oldArgs == genExtraArgs
+                and self.surv.generator.eArgs == genExtraArgs
+                and frames is self.surv.frames
+                and len(frames) == numFrames)
+
+    def forgetTruth(self):
+        """Make the next returnValue rerun the survey
+
+        Needed if the survey is changed in a way returnValue cannot
+        see, e.g. a generator function is swapped out
+        """
+        self.truth = None
+
+    def returnValues(self, matrix, seeds=None, backend=None):
+        """Return the BlackBox function value at every row of matrix
+
+        Args:
+            matrix:
+                N x dim array of scaled position vectors
+            seeds:
+                Length N list of seeds, one per row (see returnValue),
+                    or None to carry on the survey's random streams
+            backend:
+                Backend to use for this call instead of self.backend
+        Returns:
+            Length N float array of the losses, in row order
+        """
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+        if seeds is None:
+            seeds = [None]*len(matrix)
+        if len(seeds) != len(matrix):
+            raise ValueError("seeds must have one entry per row")
+        if backend is None or backend is self.backend:
+            return np.asarray(self.backend.evaluate(self, matrix,
+                                                    list(seeds)),
+                              dtype=float)
+
+        #A backend for this call only is shut down after it
+        backend = makeBackend(backend)
+        try:
+            return np.asarray(backend.evaluate(self, matrix, list(seeds)),
+                              dtype=float)
+        finally:
+            if hasattr(backend, "close"):
+                backend.close()
+
+    def close(self):
+        """Shut down the backend's worker processes, if it has any"""
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+    def scaledToRaw(self, scaled):
+        """Return the raw form of a scaled vector or N x dim matrix"""
+        return np.asarray(scaled, dtype=float)*self.halfWidth + self.center
+
     def scaledVecToRawVec(self, scaledVec):
         """Return the raw form of input scaledVec"""
-        rawVec = []
-        for i in range(len(scaledVec)):
-            raw = (scaledVec[i]*((self.rawChar[i][1]-self.rawChar[i][0])/2)
-                  +((self.rawChar[i][1]+self.rawChar[i][0])/2))
-            rawVec.append(raw)
-        return rawVec
+        return self.scaledToRaw(scaledVec).tolist()
 
     def rawVecToScaledVec(self, rawVec):
         """Return the scaled form of input rawVec"""
-        scaledVec = []
-        for i in range(len(rawVec)):
-            if self.rawChar[i][1] == self.rawChar[i][0]:
-                scaledVec.append(0)
-            else:
-                delta = rawVec[i] - ((self.rawChar[i][1]+self.rawChar[i][0])/2)
-                scaled = delta/((self.rawChar[i][1]-self.rawChar[i][0])/2)
-                scaledVec.append(scaled)
-        return scaledVec
-
-    def applyNewParams(self, scaledVec):
-        """Apply the scaledVec parameter vector to the blackbox"""
-        rawVec = self.scaledVecToRawVec(scaledVec)
+        delta = np.asarray(rawVec, dtype=float) - self.center
+        width = np.where(self.halfWidth == 0, 1, self.halfWidth)
+        return np.where(self.halfWidth == 0, 0, delta/width).tolist()
+
+    def splitScaledVec(self, scaledVec):
+        """Return the raw args of every group from a scaled vector
+
+        Returns:
+            vArgs, oArgs, hArgs, sArgs, genExtraArgs:
+                Lists of raw values. genExtraArgs holds one list per
+                generator function
+        """
+        rawVec = self.scaledToRaw(scaledVec)
+        assert len(rawVec) == len(self.rawChar)
+        groups = [rawVec[part].tolist() for part in self.layout]
+        return groups[0], groups[1], groups[2], groups[3], groups[4:]
+
+    def applyNewParams(self, scaledVec, redetect=True):
+        """Apply the scaledVec parameter vector to the blackbox
+
+        Args:
+            scaledVec:
+                position vector in the [-1,1]^N parameter space
+            redetect:
+                If False, the new profile args are only stored and the
+                    existing survey data is not re-detected. Use when
+                    the survey is about to be rerun anyway
+        """
+        vArgs, oArgs, hArgs, sArgs, genExtraArgs = self.splitScaledVec(
+                                                                scaledVec)
         surv = self.surv
-        genExtraArgs = []
-        l = self.surv.generator.eArgs
-        numGenArgs = len([item for sublist in l for item in sublist])
-        
-        for _ in range(len(self.surv.generator.eArgs)):
-            genExtraArgs.append([])
-        vArgs = []
-        lenV = len(self.surv.profile.vCharBias)
-        oArgs = []
-        lenO = len(self.surv.profile.oCharBias)
-        hArgs = []
-        lenH = len(self.surv.profile.hCharBias)
-        sArgs = []
-        lenS = len(self.surv.profile.sCharBias)
-        assert len(rawVec) == lenV + lenO + lenH + lenS + numGenArgs
-
-        for i in range(len(rawVec)):
-            if i in range(lenV):
-                vArgs.append(rawVec[i])
-            elif i - lenV in range(lenO):
-                oArgs.append(rawVec[i])
-            elif i - lenV - lenO in range(lenH):
-                hArgs.append(rawVec[i])
-            elif i - lenV - lenO - lenH in range(lenS):
-                sArgs.append(rawVec[i]) 
-            else:
-                genStart = i
-                break
-        for i in range(len(rawVec)-genStart):
-            offset = 0
-            for j in range(len(genExtraArgs)):
-                if i < len(self.surv.generator.eArgs[j]) + offset:
-                    k = j
-                    break
-                else:
-                    offset += len(self.surv.generator.eArgs[j])
-            genExtraArgs[k].append(rawVec[i+genStart])
-        
-        surv.setObservingProfileArgs(vArgs, oArgs, hArgs, sArgs)
+        if redetect:
+            surv.setObservingProfileArgs(vArgs, oArgs, hArgs, sArgs)
+        else:
+            surv.profile.vArgs = vArgs
+            surv.profile.oArgs = oArgs
+            surv.profile.hArgs = hArgs
+            surv.profile.sArgs = sArgs
         surv.setGeneratorFunctionArgs(genExtraArgs)
 
     def unpackRawCharacteristicPositionVector(self):
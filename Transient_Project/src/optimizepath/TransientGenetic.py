@@ -1,6 +1,10 @@
 import numpy as np
-import random
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy, deepcopy
+from .SuccessiveHalving import rungTimes, successiveHalving
+from .Checkpoint import (saveCheckpoint, loadCheckpoint, surveyRandomState,
+                         setSurveyRandomState)
 
 
 """To do this we will require the setup of the
@@ -8,14 +12,45 @@ TransientSurvey object to take in ranges for the different
 variables. This will allow the construction of the
 characterized genome"""
 
-binomial = np.random.binomial
-sample = random.sample
+def scoreSplitGenomes(survey, scoringFunc, splits, detectSeeds=None):
+    """Return the score of the survey under every split genome, in order
+
+    Args:
+        survey:
+            TransientSurvey holding the generation's data
+        scoringFunc:
+            As for TransientGenetic
+        splits:
+            List of [vArgs, oArgs, hArgs, sArgs] from splitGenome
+        detectSeeds:
+            Optional list of one seed per split genome. The detector
+                noise and obstruction streams of the survey are
+                reseeded with it before the genome is scored (the same
+                seed for every genome gives common random numbers).
+                None entries carry on the streams
+    """
+    if detectSeeds is None:
+        detectSeeds = [None]*len(splits)
+    scores = []
+    for split, detectSeed in zip(splits, detectSeeds):
+        if detectSeed is not None:
+            survey.random.reseed(detectSeed, ("detectorNoise", "obstruction"))
+        survey.setObservingProfileArgs(*split)
+        scores.append(scoringFunc(survey))
+    return scores
+
+def _scoreInWorker(surveyBytes, scoringFunc, splits, detectSeeds):
+    """scoreSplitGenomes on the worker's own copy of a pickled survey"""
+    return scoreSplitGenomes(pickle.loads(surveyBytes), scoringFunc,
+                             splits, detectSeeds)
 
 class TransientGenetic:
     """Class that optimizes survey score with genetic algorithm"""
 
     def __init__(self, survey, scoringFunc, surveyTime,
-                 popSize, mutRate, crossRate, totalGenerations):
+                 popSize, mutRate, crossRate, totalGenerations,
+                 seed=None, commonRandomNumbers=True, workers=None,
+                 rungs=1, eta=3, checkpointPath=None, checkpointEvery=1):
         """
         Args:
             survey:
@@ -30,8 +65,54 @@ class TransientGenetic:
             totalGenerations:
                 number of times to breed: i.e. number of iterations
                 of the *genetic algorithm* you want to run
+            seed:
+                Seed for breeding and for the survey data of every
+                generation. None seeds from the OS
+            commonRandomNumbers:
+                bool. If True, every genome of a generation is scored
+                    with the same detector noise and obstruction
+                    random numbers, so that differences in score come
+                    from the genomes and not from the noise. If False,
+                    every genome is scored with a seed of its own
+            workers:
+                Number of processes to score the population with.
+                    None or 1 scores in this process. Each worker
+                    scores a share of the genomes on its own copy of
+                    the generation's survey, so the survey and
+                    scoringFunc must be picklable (plugins defined at
+                    module level). With commonRandomNumbers the scores
+                    are the same as when scoring in this process
+            rungs:
+                Number of survey lengths to score each generation on
+                    (successive halving, see SuccessiveHalving.py).
+                    Every genome is scored on a survey
+                    surveyTime/eta**(rungs-1) long, the best 1/eta are
+                    scored again on one eta times longer, and so on up
+                    to surveyTime. The generation's survey is only
+                    simulated once, and extended between rungs.
+                    1 scores every genome on the full survey
+            eta:
+                Factor by which the survey length grows, and the
+                    number of genomes shrinks, from one rung to the next
+            checkpointPath:
+                File to write the state of the run to after every
+                    checkpointEvery generations (see Checkpoint.py),
+                    or None. A stopped run is continued with resume,
+                    on a TransientGenetic made with the same arguments
         
         """
+        self.rng = np.random.default_rng(seed)
+        self.commonRandomNumbers = commonRandomNumbers
+        self.workers = workers
+        self.pool = None
+        self.rungs = rungs
+        self.eta = eta
+        self.checkpointPath = checkpointPath
+        self.checkpointEvery = checkpointEvery
+        self.generation = 0
+
+        #Number of survey frames scored in the last generation
+        self.framesScored = 0
 
         self.vChar = deepcopy(survey.profile.vCharPath)
         self.oChar = deepcopy(survey.profile.oCharPath)
@@ -62,19 +143,63 @@ class TransientGenetic:
 
     def runForAllGenerations(self):
         """Run all the iterations of the algorithm and return best genome"""
-        for _ in range(self.totalGenerations):
-            self.iterate()
+        try:
+            while self.generation < self.totalGenerations:
+                self.iterate()
+                self.generation += 1
+                if (self.checkpointPath is not None
+                        and (self.generation % self.checkpointEvery == 0
+                             or self.generation == self.totalGenerations)):
+                    saveCheckpoint(self.checkpointPath, self.state())
+        finally:
+            self.close()
         for i in range(len(self.population)):
             if self.scorelist[i] == max(self.scorelist):
                 return self.population[i]
     
+    def resume(self, path=None):
+        """Continue runForAllGenerations from its last checkpoint
+
+        Args:
+            path:
+                Checkpoint file. Defaults to self.checkpointPath
+        Returns:
+            As runForAllGenerations
+        """
+        self.setState(loadCheckpoint(path or self.checkpointPath))
+        return self.runForAllGenerations()
+
+    def state(self):
+        """Return the state of the run, as written to checkpoints"""
+        return {"generation": self.generation,
+                "population": self.population,
+                "scorelist": self.scorelist,
+                "framesScored": self.framesScored,
+                "rng": self.rng.bit_generator.state,
+                "survey": surveyRandomState(self.surv)}
+
+    def setState(self, state):
+        """Restore the run to a state returned by self.state"""
+        if any(len(genome) != self.genomeLength
+               for genome in state["population"]):
+            raise ValueError("Checkpoint genomes do not match the "
+                             + "characteristic genome")
+        self.generation = state["generation"]
+        self.population = [list(genome) for genome in state["population"]]
+        self.scorelist = list(state["scorelist"])
+        self.framesScored = state["framesScored"]
+        self.rng.bit_generator.state = state["rng"]
+        setSurveyRandomState(self.surv, state["survey"])
+
     def iterate(self):
         """Breed a new generation and score them"""
         
         #Generate a new set of survey data
         #We generate new data each time to reduce
         #overfitting
-        self.surv.reRunSurvey(self.runTime)
+        times = rungTimes(self.runTime, self.rungs, self.eta)
+        self.surv.reRunSurvey(times[0], int(self.rng.integers(2**63)))
+        detectSeed = int(self.rng.integers(2**63))
         
         #Breed the current population and then replace the
         #lower-scoring half with the babies
@@ -82,15 +207,58 @@ class TransientGenetic:
         scores = self.scorelist
         self.population = self.breedPopulation(pop, scores)
         
-        #Re score every genome on the new set of survey data
-        self.scorelist = []
-        for genome in self.population:
-            split = self.splitGenome(genome)
-            self.surv.setObservingProfileArgs(*split)
-            
-            newScore = self.score(self.surv)
-            self.scorelist.append(newScore)
+        #Re score every genome on the new set of survey data. Without
+        #   common random numbers every genome still gets a seed of its
+        #   own, so that the scores do not depend on how the genomes
+        #   are shared out among the workers
+        splits = [self.splitGenome(genome) for genome in self.population]
+
+        def scoreAt(indices, time):
+            self.surv.extendSurvey(time)
+            if self.commonRandomNumbers:
+                seeds = [detectSeed]*len(indices)
+            else:
+                seeds = [int(self.rng.integers(2**63)) for _ in indices]
+            return self.scorePopulation([splits[i] for i in indices],
+                                        seeds)
 
+        scores, self.framesScored = successiveHalving(len(splits), scoreAt,
+                                                      times, self.eta)
+        self.scorelist = scores.tolist()
+
+    def scorePopulation(self, splits, detectSeeds=None):
+        """Return the score of every split genome, in order
+
+        Spread over self.workers processes if there is more than one.
+        detectSeeds is as for scoreSplitGenomes
+        """
+        if detectSeeds is None:
+            detectSeeds = [None]*len(splits)
+        if self.workers is None or self.workers <= 1 or len(splits) < 2:
+            return scoreSplitGenomes(self.surv, self.score, splits,
+                                     detectSeeds)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        #One contiguous share of the genomes per worker, so that each
+        #   worker unpickles the survey once per generation
+        surveyBytes = pickle.dumps(self.surv)
+        shares = np.array_split(np.arange(len(splits)),
+                                min(self.workers, len(splits)))
+        futures = [self.pool.submit(_scoreInWorker, surveyBytes, self.score,
+                                    [splits[i] for i in share],
+                                    [detectSeeds[i] for i in share])
+                   for share in shares]
+        scores = []
+        for future in futures:
+            scores += future.result()
+        return scores
+
+    def close(self):
+        """Shut down the worker processes, if any"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
 
     def getRandomGenome(self):
@@ -98,9 +266,9 @@ class TransientGenetic:
         genome = []
         for cG in self.charGenome:
             if cG[2].lower().strip() == "int":
-                genome.append(np.random.randint(cG[0], cG[1]))
+                genome.append(self.rng.integers(cG[0], cG[1]))
             elif cG[2].lower().strip() == "float":
-                genome.append(np.random.uniform(cG[0], cG[1]))
+                genome.append(self.rng.uniform(cG[0], cG[1]))
             else:
                 raise ValueError("characteristicGene[2] neither "
                                 + "'int' nor 'float' ")
@@ -123,9 +291,9 @@ class TransientGenetic:
                 low/high are the inclusive/exclusive bounds on """
         cG = characteristicGene
         if cG[2].lower().strip() == "int":
-            return np.random.randint(cG[0], cG[1])
+            return self.rng.integers(cG[0], cG[1])
         elif cG[2].lower().strip() == "float":
-            return np.random.uniform(cG[0], cG[1])
+            return self.rng.uniform(cG[0], cG[1])
         else:
             raise ValueError("characteristicGene[2] neither "
                               + "'int' nor 'float' ")
@@ -173,8 +341,8 @@ class TransientGenetic:
             raise IndexError("Genome lengths mismatched")
         
         #Get number of crossovers and mutations to be applied
-        crossovers = binomial(len(mother), self.crossRate)
-        mutations = binomial(len(mother), self.mutRate)
+        crossovers = self.rng.binomial(len(mother), self.crossRate)
+        mutations = self.rng.binomial(len(mother), self.mutRate)
 
         #Get where in the genome they occur
             #here we're choosing that all locations in the genome
@@ -184,8 +352,7 @@ class TransientGenetic:
         
         #Get where in the genome the crossover will occur
         #Sort the locations for iteration further on
-        crossLocations = sample(geneNumbers, crossovers)
-        crossLocations.sort()
+        crossLocations = self.sample(geneNumbers, crossovers)
         
         #Use copies to prevent editing the actual parents
         altmother = copy(mother)
@@ -203,11 +370,8 @@ class TransientGenetic:
                 child2[i:] = altfather[i:]
 
         #Find where the child genomes mutate
-        mutationLocations1 = sample(geneNumbers, mutations)
-        mutationLocations1.sort()
-
-        mutationLocations2 = sample(geneNumbers, mutations)
-        mutationLocations2.sort()
+        mutationLocations1 = self.sample(geneNumbers, mutations)
+        mutationLocations2 = self.sample(geneNumbers, mutations)
 
         #Apply mutations
         for location in mutationLocations1:
@@ -218,9 +382,13 @@ class TransientGenetic:
 
         return [child1, child2]
     
+    def sample(self, population, k):
+        """Return a sorted list of k distinct items of population"""
+        return sorted(self.rng.choice(population, k, replace=False).tolist())
+
     def getSelection(self, probList):
         """Return a selection from a 'cdf' probList"""
-        rand = np.random.rand()
+        rand = self.rng.random()
         selection = None
         for i in range(len(probList)):
             if probList[i] > rand and selection is None:
@@ -235,44 +403,50 @@ class TransientGenetic:
                 list of genomes that were scored in the last round
             
             scorelist:
-                List of ints. The ith int is the score of the ith
-                genome in population
+                List of numbers. The ith number is the score of the ith
+                genome in population. Higher => better. Scores may be
+                negative (e.g. carried down by successive halving):
+                they are shifted so that the worst genome has fitness 0
 
         Returns:
             mother, father:
                 indexes of mother and father genome
                 
         """
-        totalFitness = np.sum(scorelist)
-        sumProbability = 0
-        probs = []
-        
-        for fitness in scorelist:
-            #Demarkate the borders by which a random number
-            #uniformly drawn in [0,1) is converted to 
-            #a selection
-            #This is done using the getSelection function
-            fitProb = sumProbability + fitness/totalFitness
-            probs.append(fitProb)
-            sumProbability = probs[-1]
+        fitness = np.asarray(scorelist, dtype=float)
+        fitness = fitness - fitness.min()
+        if fitness.sum() > 0:
+            weights = fitness/fitness.sum()
+        else:
+            weights = np.full(len(fitness), 1/len(fitness))
+        if np.count_nonzero(weights) < 2:
+            #One genome holds all of the fitness. Give the rest a
+            #   little so it has someone to breed with
+            weights = weights + 1e-3/len(weights)
+            weights /= weights.sum()
+
+        #Demarkate the borders by which a random number
+        #uniformly drawn in [0,1) is converted to 
+        #a selection
+        #This is done using the getSelection function
+        probs = np.cumsum(weights)
+        #Rounding must not leave a gap below 1 at the top
+        probs[probs >= probs[-1]] = 1.0
         
         #Use the borders to get the parents
-        mother = population[self.getSelection(probs)]
-        father = population[self.getSelection(probs)]
-        
-        #Check for erros
-        if mother is None or father is None:
-            raise ValueError("No probability was high enough")
-
-        #Ensure the pair is different
-        pathologicalScore = 0
-        while mother is father:
-            father = population[self.getSelection(probs)]
-            pathologicalScore += 1
-            if pathologicalScore > 5:
-                raise ValueError("mother == father and can't escape")
+        motherIndex = self.getSelection(probs)
+        fatherIndex = self.getSelection(probs)
+
+        #Ensure the pair is different: the father is drawn again from
+        #   everyone but the mother
+        if fatherIndex == motherIndex:
+            others = weights.copy()
+            others[motherIndex] = 0
+            probs = np.cumsum(others/others.sum())
+            probs[probs >= probs[-1]] = 1.0
+            fatherIndex = self.getSelection(probs)
             
-        return [mother, father]
+        return [population[motherIndex], population[fatherIndex]]
 
     def breedPopulation(self, population, scorelist):
         """Return new population after weighted breeding"""
@@ -1,38 +1,79 @@
 """
-Guess intrinsic distribution using a naive genetic algorithm
+Guess intrinsic distribution using a genetic algorithm
+
+The genomes are the extra args of the survey's generator functions,
+within the ranges of survey.generator.charBias. The population is held
+as a popSize x genomeLength array, so selection, crossover and
+mutation act on the whole generation at once. Every genome changes the
+simulated truth, so scoring a genome means simulating the survey; the
+genomes of a generation can be simulated in parallel worker processes.
 """
 
 import numpy as np
-import random
-from copy import copy, deepcopy
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from .SuccessiveHalving import rungTimes, successiveHalving
+
+def scoreGenomes(survey, lossFunction, comparisonData, argsList, time,
+                 seeds=None):
+    """Return the loss of the survey under every generator args, in order
+
+    Args:
+        survey:
+            TransientSurvey to simulate
+        lossFunction, comparisonData:
+            As for TransientIntrinsicExtractor
+        argsList:
+            List of generator extraArgs (lists of lists)
+        time:
+            Number of time-steps to simulate each genome for
+        seeds:
+            Optional list of one seed per genome to simulate it with
+                (the same seed for every genome gives common random
+                numbers). None entries carry on the survey's streams
+    """
+    if seeds is None:
+        seeds = [None]*len(argsList)
+    scores = []
+    for args, seed in zip(argsList, seeds):
+        survey.setGeneratorFunctionArgs(args)
+        survey.reRunSurvey(time, seed)
+        scores.append(lossFunction(survey, comparisonData))
+    return scores
 
+#(survey, lossFunction, comparisonData) of a worker process,
+#   set by _initWorker
+_workerState = None
 
-"""To do this we will require the setup of the
-TransientSurvey object to take in ranges for the different
-variables. This will allow the construction of the
-characterized genome"""
+def _initWorker(surveyBytes, lossFunction, comparisonData):
+    global _workerState
+    _workerState = (pickle.loads(surveyBytes), lossFunction, comparisonData)
 
-binomial = np.random.binomial
-sample = random.sample
+def _scoreInWorker(argsList, time, seeds):
+    """scoreGenomes on the worker's own copy of the survey"""
+    return scoreGenomes(*_workerState, argsList, time, seeds)
 
 class TransientIntrinsicExtractor:
-    """Class that optimizes survey score with genetic algorithm
-    
-    This is hideously slow. Basically, never use it.    
-    """
+    """Class that optimizes survey score with genetic algorithm"""
 
     def __init__(self, survey, lossFunction, surveyTime,
-                 popSize, mutRate, crossRate, comparisonData):
+                 popSize, mutRate, crossRate, comparisonData,
+                 rungs=1, eta=3, totalGenerations=1, seed=None,
+                 commonRandomNumbers=True, workers=None):
         """
         WARNING: THIS LOSSFUNCTION MUST RETURN NEGATIVE VALUES (OR 0)
         Args:
             survey:
                 The TransientSurvey object to run and reset
-                in order to optimize
+                in order to optimize. The genes are the extra args of
+                its generator functions, with the ranges in
+                survey.generator.charBias. A range may have a third
+                entry, "int" or "float" (the default); int genes take
+                whole values from min to max inclusive
             lossFunction:
                 Function. Returns the deviation from comparisonData
                     Always returns values <= 0
-                    Args: 
+                    Args:
                         survey:
                             The survey to be scored
                         comparisonData:
@@ -46,8 +87,34 @@ class TransientIntrinsicExtractor:
             crossRate:
                 probability of crossover in breeding
                     Higher means a more "finely mixed" child genome
-
-        
+            rungs:
+                Number of survey lengths to score each generation on
+                    (successive halving, see SuccessiveHalving.py).
+                    Every genome is scored on a survey
+                    surveyTime/eta**(rungs-1) long, the best 1/eta are
+                    scored again on one eta times longer, and so on up
+                    to surveyTime. 1 scores every genome on the full
+                    survey
+            eta:
+                Factor by which the survey length grows, and the
+                    number of genomes shrinks, from one rung to the next
+            totalGenerations:
+                number of times runForAllGenerations breeds
+            seed:
+                Seed for breeding and for the simulations. None seeds
+                    from the OS
+            commonRandomNumbers:
+                bool. If True, every genome of a generation is
+                    simulated with the same seed, so that differences
+                    in score come from the genomes and not from the
+                    noise. If False, every genome is simulated with a
+                    seed of its own
+            workers:
+                Number of processes to simulate the genomes with.
+                    None or 1 simulates them in this process. Every
+                    worker keeps its own copy of the survey, so the
+                    survey, lossFunction and comparisonData must be
+                    picklable (plugins defined at module level)
         """
 
         self.loss = lossFunction
@@ -56,236 +123,221 @@ class TransientIntrinsicExtractor:
         self.surv = survey
         self.crossRate = crossRate
         self.mutRate = mutRate
-        self.charGenome = self.surv.generator.char
-        
+        self.rungs = rungs
+        self.eta = eta
+        self.totalGenerations = totalGenerations
+        self.rng = np.random.default_rng(seed)
+        self.commonRandomNumbers = commonRandomNumbers
+        self.workers = workers
+        self.pool = None
+
+        #Number of survey frames simulated in the last generation
+        self.framesScored = 0
+
+        #Flatten the ranges of every generator function's args
+        self.charGenome = []
+        self.argLengths = []
+        for funcBias in self.surv.generator.charBias:
+            self.charGenome += list(funcBias)
+            self.argLengths.append(len(funcBias))
+        self.genomeLength = len(self.charGenome)
+        self.low = np.array([cG[0] for cG in self.charGenome], dtype=float)
+        self.high = np.array([cG[1] for cG in self.charGenome], dtype=float)
+        self.isInt = np.array([len(cG) > 2
+                               and cG[2].lower().strip() == "int"
+                               for cG in self.charGenome], dtype=bool)
+        for cG in self.charGenome:
+            if len(cG) > 2 and cG[2].lower().strip() not in ("int", "float"):
+                raise ValueError("characteristicGene[2] neither "
+                                 + "'int' nor 'float' ")
+
         #Ensure that popsize is divisible by 4
         #This is because the structure of our
         #population-level breeding algorithm requires it
         self.popSize = popSize
         if self.popSize % 4 > 0:
             self.popSize += (4 - self.popSize%4)
-        
-        self.genomeLength = len(self.charGenome)
+
         self.population = self.getRandomPopulation()
-        self.scorelist = [1]*len(self.population)
+        self.scorelist = np.zeros(self.popSize)
+
+    def runForAllGenerations(self):
+        """Run all the iterations of the algorithm and return best args"""
+        try:
+            for _ in range(self.totalGenerations):
+                self.iterate()
+        finally:
+            self.close()
+        return self.bestArgs()
+
+    def bestArgs(self):
+        """Return the generator extraArgs of the best scoring genome"""
+        return self.genomeToArgs(self.population[np.argmax(self.scorelist)])
 
     def iterate(self):
         """Breed a new generation and score them"""
-        
+
         #Breed the current population and then replace the
         #lower-scoring half with the babies
-        pop = self.population
-        scores = self.scorelist
-        self.population = self.breedPopulation(pop, scores)
-        
-        #Score every bred genome
-        self.scorelist = []
-        for genome in self.population:
-            
-            self.surv.setGeneratorFunctionArgs(genome)
-            self.surv.reRunSurvey(self.runTime)
-            
-            newScore = self.loss(self.surv, self.compare)
-            self.scorelist.append(newScore)
-
-
-
-    def getRandomGenome(self):
-        """Return a random genome from the characteristic genome"""
-        genome = []
-        for i in range(len(self.charGenome)):
-            genome.append([])
-            for cG in self.charGenome[i]:
-                if cG[2].lower().strip() == "int":
-                    genome[-1].append(np.random.randint(cG[0], cG[1]))
-                elif cG[2].lower().strip() == "float":
-                    genome[-1].append(np.random.uniform(cG[0], cG[1]))
-                else:
-                    raise ValueError("characteristicGene[2] neither "
-                                    + "'int' nor 'float' ")
-        return genome
-    
-    def getRandomPopulation(self):
-        """Return a population of random genomes"""
-        pop = []
-        for _ in range(self.popSize):
-            pop.append(self.getRandomGenome)
-        return pop
-    
-    def mutate(self, characteristicGene):
-        """Return random legal value for a given gene
-        
-        Args:
-            CharacteristicGene
-                A 3-tuple of (low, high, type). type is
-                a string, either "int" or "float". and 
-                low/high are the inclusive/exclusive bounds on """
-        cG = characteristicGene
-        if cG[2].lower().strip() == "int":
-            return np.random.randint(cG[0], cG[1])
-        elif cG[2].lower().strip() == "float":
-            return np.random.uniform(cG[0], cG[1])
+        self.population = self.breedPopulation(self.population,
+                                               self.scorelist)
+
+        #Score every bred genome. Each genome changes the simulated
+        #   truth, so every genome is simulated from the start on every
+        #   rung it reaches, with the same seed. Without common random
+        #   numbers every genome still gets a seed of its own, so that
+        #   the scores do not depend on how the genomes are shared out
+        #   among the workers
+        if self.commonRandomNumbers:
+            seeds = [int(self.rng.integers(2**63))]*self.popSize
         else:
-            raise ValueError("characteristicGene[2] neither "
-                              + "'int' nor 'float' ")
+            seeds = [int(self.rng.integers(2**63))
+                     for _ in range(self.popSize)]
+        argsList = [self.genomeToArgs(genome) for genome in self.population]
+
+        def scoreAt(indices, time):
+            return self.scoreArgs([argsList[i] for i in indices], time,
+                                  [seeds[i] for i in indices])
+
+        self.scorelist, self.framesScored = successiveHalving(
+                            self.popSize, scoreAt,
+                            rungTimes(self.runTime, self.rungs, self.eta),
+                            self.eta)
+
+    def scoreArgs(self, argsList, time, seeds=None):
+        """Return the loss of every generator args, in order
 
+        Spread over self.workers processes if there is more than one.
+        seeds is as for scoreGenomes
+        """
+        if seeds is None:
+            seeds = [None]*len(argsList)
+        if self.workers is None or self.workers <= 1 or len(argsList) < 2:
+            return scoreGenomes(self.surv, self.loss, self.compare,
+                                argsList, time, seeds)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                                max_workers=self.workers,
+                                initializer=_initWorker,
+                                initargs=(pickle.dumps(self.surv),
+                                          self.loss, self.compare))
+
+        #One contiguous share of the genomes per worker
+        shares = np.array_split(np.arange(len(argsList)),
+                                min(self.workers, len(argsList)))
+        futures = [self.pool.submit(_scoreInWorker,
+                                    [argsList[i] for i in share],
+                                    time, [seeds[i] for i in share])
+                   for share in shares]
+        scores = []
+        for future in futures:
+            scores += future.result()
+        return scores
+
+    def close(self):
+        """Shut down the worker processes, if any"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
-    
-    def breed(self, supermother, superfather):
+    def genomeToArgs(self, genome):
+        """Return a genome as generator extraArgs: one list per function"""
+        values = [int(round(value)) if isInt else float(value)
+                  for value, isInt in zip(genome, self.isInt)]
+        bounds = np.cumsum([0] + self.argLengths)
+        return [values[bounds[i]:bounds[i+1]]
+                for i in range(len(self.argLengths))]
+
+    def randomGenes(self, shape):
+        """Return an array of random legal genes
+
+        Args:
+            shape:
+                Shape of the array. The last axis runs over the genome
+        """
+        genes = self.rng.uniform(self.low, self.high, shape)
+        if self.isInt.any():
+            #Whole values from low to high inclusive
+            whole = np.floor(self.rng.uniform(self.low, self.high + 1, shape))
+            genes = np.where(self.isInt, np.minimum(whole, self.high), genes)
+        return genes
+
+    def getRandomPopulation(self):
+        """Return a popSize x genomeLength array of random genomes"""
+        return self.randomGenes((self.popSize, self.genomeLength))
+
+    def breed(self, mothers, fathers):
         """Return child-genomes from crossover and mutation
-        
+
         Args:
-            mother/father: 
-                Lists of numbers. genomes of the two parents. 
-            characteristicGenome:
-                List of 3-tuples of the form (low, high, type). 
-                The ith 3-tuple in this list represents
-                the values and types that the
-                ith gene in the child genomes can take on.
-                The 'type' is either 'float' or 'int' depending
-                on whether fractional values are supported.
-                The selection is inclusive on low and exclusive on 
-                high
-        
-        Returns: Length 2 List of child-genomes        
+            mothers/fathers:
+                n x genomeLength arrays. The ith rows are the genomes
+                    of the ith pair of parents
+
+        Returns:
+            2n x genomeLength array. Two children per pair, who are
+                "inverses" of each other before mutation
         """
-        superchild1 = []
-        superchild2 = []
-        for i in range(len(supermother)):
-            mother = supermother[i]
-            father = superfather[i]
-            cG = self.charGenome[i]
-            
-            #apologies for heteronormativity
-            if len(mother) != len(father):
-                raise IndexError("Genome lengths mismatched")
-            
-            #Get number of crossovers and mutations to be applied
-            crossovers = binomial(len(mother), self.crossRate)
-            mutations = binomial(len(mother), self.mutRate)
-
-            #Get where in the genome they occur
-                #here we're choosing that all locations in the genome
-                #are equally probable locations for mutation/crossover
-            #The use of geneNumbers is for readability
-            geneNumbers = range(self.genomeLength)
-            
-            #Get where in the genome the crossover will occur
-            #Sort the locations for iteration further on
-            crossLocations = sample(geneNumbers, crossovers)
-            crossLocations.sort()
-            
-            #Use copies to prevent editing the actual parents
-            altmother = copy(mother)
-            altfather = copy(father)
-            
-            #Produce two children who are "inverses" of each other
-            child1 = [0] * len(altmother)
-            child2 = [0] * len(altfather)
-            for i in range(crossovers):
-                if i % 2 == 0:
-                    child1[i:] = altfather[i:]
-                    child2[i:] = altmother[i:]
-                else:
-                    child1[i:] = altmother[i:]
-                    child2[i:] = altfather[i:]
-
-            #Find where the child genomes mutate
-            mutationLocations1 = sample(geneNumbers, mutations)
-            mutationLocations1.sort()
-
-            mutationLocations2 = sample(geneNumbers, mutations)
-            mutationLocations2.sort()
-
-            #Apply mutations
-            for location in mutationLocations1:
-                child1[location] = self.mutate(cG[location])
-
-            for location in mutationLocations2:
-                child2[location] = self.mutate(cG[location])
-            
-            superchild1.append(child1)
-            superchild2.append(child2)
-        return [superchild1, superchild2]
-    
-    def getSelection(self, probList):
-        """Return a selection from a 'cdf' probList"""
-        rand = np.random.rand()
-        selection = None
-        for i in range(len(probList)):
-            if probList[i] > rand and selection is None:
-                selection = i
-        return selection
-    
-    def rouletteSelect(self, population, scorelist):
-        """Return a pair of parents from weighted random selection
-        
+        n = len(mothers)
+
+        #Every position is a crossover point with probability
+        #   crossRate. Children take genes from the mother up to the
+        #   first crossover point, then from the father up to the next
+        #   one, and so on
+        crossovers = self.rng.random((n, self.genomeLength)) < self.crossRate
+        fromFather = np.cumsum(crossovers, axis=1) % 2 == 1
+        children = np.concatenate([np.where(fromFather, fathers, mothers),
+                                   np.where(fromFather, mothers, fathers)])
+
+        #Apply mutations
+        mutations = self.rng.random(children.shape) < self.mutRate
+        return np.where(mutations, self.randomGenes(children.shape),
+                        children)
+
+    def rouletteSelect(self, scorelist, pairs):
+        """Return pairs of parents from weighted random selection
+
         Args:
-            population:
-                list of genomes that were scored in the last round
-            
             scorelist:
-                List of ints. The ith int is the score of the ith
-                genome in population
+                Scores of the genomes that were scored in the last round
+            pairs:
+                Number of pairs to select
 
         Returns:
-            mother, father:
-                indexes of mother and father genome
-                
+            mothers, fathers:
+                Length pairs integer arrays. Indexes of the mother and
+                    father genomes. A genome is never paired with itself
         """
-        minscore = np.min(scorelist)
-        augscorelist = [(score - minscore) for score in scorelist]
-        totalFitness = np.sum(augscorelist)
-        sumProbability = 0
-        probs = []
-        
-        for fitness in augscorelist:
-            #Demarkate the borders by which a random number
-            #uniformly drawn in [0,1) is converted to 
-            #a selection
-            #This is done using the getSelection function
-            fitProb = sumProbability + fitness/totalFitness
-            probs.append(fitProb)
-            sumProbability = probs[-1]
-        
-        #Use the borders to get the parents
-        mother, father = self.getSelection(probs), self.getSelection(probs)
-        
-        #Check for erros
-        if mother is None or father is None:
-            raise ValueError("No probability was high enough")
-
-        #Ensure the pair is different
-        pathologicalScore = 0
-        while mother == father:
-            father = self.getSelection(probs)
-            pathologicalScore += 1
-            if pathologicalScore > 100:
-                raise ValueError("mother == father and can't escape")
-            
-        return [mother, father]
+        fitness = np.asarray(scorelist, dtype=float)
+        fitness = fitness - fitness.min()
+        if fitness.sum() > 0:
+            probs = fitness/fitness.sum()
+        else:
+            probs = np.full(len(fitness), 1/len(fitness))
+        if np.count_nonzero(probs) < 2:
+            #One genome holds all of the fitness. Give the rest a
+            #   little so it has someone to breed with
+            probs = probs + 1e-3/len(probs)
+            probs /= probs.sum()
+
+        mothers = self.rng.choice(len(probs), pairs, p=probs)
+        fathers = self.rng.choice(len(probs), pairs, p=probs)
+        same = mothers == fathers
+        while same.any():
+            fathers[same] = self.rng.choice(len(probs), same.sum(), p=probs)
+            same = mothers == fathers
+        return mothers, fathers
 
     def breedPopulation(self, population, scorelist):
-        """Return new population after weighted breeding"""
-        
-        numGenome = len(population)
-        
-        #here we ensure the popsize is divisible by 4.
-        #This is because we replace half the population with
-        #breeded children, and the breed function returns children
-        #pairs. So to produce half of the population using pairs,
-        #the population must be divisible by 4
-        if numGenome % 4 > 0:
-            numGenome += (4 - numGenome%4)
-        
-        babies = []
-        for _ in range(numGenome/4):
-            #Select parents from the roulette
-            parents = self.rouletteSelect(population, scorelist)
-            
-            #Make a pair of children fr
-            babies += self.breed(*parents)
-
-        newPop = population[:numGenome/2] + babies
-
-        return newPop
\ No newline at end of file
+        """Return new population after weighted breeding
+
+        The better scoring half of the population is kept, and the
+        other half is replaced with children
+        """
+        #popSize is divisible by 4 so that the children, made in
+        #   pairs, fill exactly half of the population
+        half = self.popSize//2
+        mothers, fathers = self.rouletteSelect(scorelist, half//2)
+        babies = self.breed(population[mothers], population[fathers])
+        best = np.argsort(-np.asarray(scorelist), kind="stable")[:half]
+        return np.concatenate([population[best], babies])
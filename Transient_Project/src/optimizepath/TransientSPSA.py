@@ -3,17 +3,43 @@ Simultaneous Perterbation Stochastic Approximation implementation
 for bias analysis
 """
 import numpy as np
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
+from .Checkpoint import (saveCheckpoint, loadCheckpoint, surveyRandomState,
+                         setSurveyRandomState)
+
+#The black box of a worker process, set by _initWorker
+_workerBlackBox = None
+
+def _initWorker(blackBoxBytes):
+    global _workerBlackBox
+    _workerBlackBox = pickle.loads(blackBoxBytes)
+
+def _evaluateInWorker(scaledVec, seed):
+    return evaluate(_workerBlackBox, scaledVec, seed)
+
+def evaluate(blackBox, scaledVec, seed=None):
+    """Return blackBox.returnValue at scaledVec, seeded if seed is given"""
+    if seed is None:
+        return blackBox.returnValue(scaledVec)
+    return blackBox.returnValue(scaledVec, seed=seed)
 
 class TransientSPSA:
 
 
-    def __init__(self, blackBox, Q, startingVec, alpha=1.0, gamma=1.0/6):
+    def __init__(self, blackBox, Q, startingVec, alpha=None, gamma=1.0/6,
+                 seed=None, commonRandomNumbers=True, perturbations=1,
+                 workers=None, checkpointPath=None, checkpointEvery=1,
+                 secondOrder=False, hessianFloor=1e-2, maxStep=None,
+                 calibration=0, initialStep=0.1, tolerance=None,
+                 patience=5):
         """
         Args: 
             blackBox:
                 A TransientBlackBox object. Can be replace with
                 any class that has a returnValue method that returns float
+                (and takes a seed keyword if commonRandomNumbers is True)
             Q:
                 Number of iterations to run the SPSA algorithm
             startingVec:
@@ -21,13 +47,94 @@ class TransientSPSA:
             alpha:
                 a parameter that controls the step size sequence
                 must satisfy 
+                Defaults to 1, or to 0.602 with secondOrder (Spall's
+                    recommendation for 2SPSA, whose steps must not
+                    shrink as fast)
+            seed:
+                Seed for the perturbations and the simulation seeds.
+                    None seeds from the OS
+            commonRandomNumbers:
+                bool. If True, the two evaluations of each gradient
+                    estimate are run with the same simulation seed, so
+                    the noise in the simulation mostly cancels out of
+                    Yplus - Yminus
+            perturbations:
+                Number of independent Bernoulli perturbations per
+                    iteration. Their gradient estimates are averaged,
+                    which lowers the variance of every step
+            workers:
+                Number of processes to evaluate the 2*perturbations
+                    points of an iteration with. None or 1 evaluates
+                    them in this process. Every worker keeps its own
+                    copy of the black box, which must be picklable.
+                    The copies all start from the same random state,
+                    so without commonRandomNumbers every point is
+                    given a seed of its own (the black box must then
+                    take a seed keyword)
+            checkpointPath:
+                File to write the state of the run to (see
+                    Checkpoint.py), or None. A stopped run is continued
+                    with resume. The run continues exactly as it would
+                    have if the black box is rebuilt the same way and
+                    its evaluations depend only on the seeds given to
+                    it (commonRandomNumbers or workers), or on the
+                    random streams of blackBox.surv
+            checkpointEvery:
+                Number of iterations between checkpoints
+            secondOrder:
+                bool. If True, run adaptive SPSA (2SPSA): every
+                    perturbation also evaluates two points with a
+                    second perturbation, 4 evaluations in all, which
+                    give an estimate of the Hessian. The running mean
+                    of the Hessian estimates rescales every step
+                    (r -= a(n) * H^-1 gradient), so ill-conditioned
+                    losses converge in far fewer iterations
+            hessianFloor:
+                The eigenvalues of the mean Hessian are made positive
+                    and raised to at least hessianFloor times the
+                    largest, so that it can be inverted
+            maxStep:
+                If given, steps that would move a coordinate further
+                    than maxStep are shortened to move it by maxStep.
+                    Protects against the early, noisy Hessian
+                    estimates of secondOrder
+            calibration:
+                Number of gradient estimates made at startingVec before
+                    the first iteration to calibrate the step size:
+                    the step sizes are scaled so that the first step
+                    moves the largest coordinate by about initialStep.
+                    0 keeps the step sizes a(n). Not used with
+                    secondOrder, whose steps are scaled by the Hessian
+            initialStep:
+                See calibration
+            tolerance:
+                If given, minimize stops before Q iterations once no
+                    coordinate has moved more than tolerance in each
+                    of the last patience iterations
+            patience:
+                See tolerance
         """
         self.bb = blackBox
         self.Q = Q
-        self.r0 = np.asarray(startingVec, dtype=np.float)
+        self.r0 = np.asarray(startingVec, dtype=float)
         self.alpha = alpha
+        if self.alpha is None:
+            self.alpha = 0.602 if secondOrder else 1.0
         self.gamma = gamma
         self.dim = len(startingVec)
+        self.rng = np.random.default_rng(seed)
+        self.commonRandomNumbers = commonRandomNumbers
+        self.perturbations = perturbations
+        self.workers = workers
+        self.checkpointPath = checkpointPath
+        self.checkpointEvery = checkpointEvery
+        self.secondOrder = secondOrder
+        self.hessianFloor = hessianFloor
+        self.maxStep = maxStep
+        self.calibration = calibration
+        self.initialStep = initialStep
+        self.tolerance = tolerance
+        self.patience = patience
 
     def a(self,n):
         """Return the nth value of the step-size sequence"""
@@ -45,28 +152,220 @@ class TransientSPSA:
 
     def bernoulli(self, N):
         """Return a bernoulli distributed N-dimensional numpy vector"""
-        bern = np.random.choice([-1/2,1/2], N)
+        bern = self.rng.choice([-1/2,1/2], N)
         return bern
 
+    def evaluatePoints(self, points, pool=None):
+        """Return the black box value at every (scaledVec, seed) point
+
+        Args:
+            points:
+                List of (scaledVec, seed) pairs. seed may be None
+            pool:
+                Executor of worker processes, or None to evaluate with
+                    the black box's returnValues if it has one
+        """
+        vecs, seeds = zip(*points)
+        if pool is not None:
+            #Unseeded points would carry on the same random streams in
+            #   every worker, so they would share their noise
+            seeds = [int(self.rng.integers(2**63)) if seed is None else seed
+                     for seed in seeds]
+            return list(pool.map(_evaluateInWorker, vecs, seeds))
+        if hasattr(self.bb, "returnValues"):
+            return list(self.bb.returnValues(np.array(vecs), seeds))
+        return [evaluate(self.bb, vec, seed) for vec, seed in points]
+
     def minimize(self):
         """Return minimized raw parameters"""
         self.iterations = 0
-        r = deepcopy(self.r0)
-        for i in range(self.Q):
+        self.r = deepcopy(self.r0)
+        self.hessian = np.zeros((self.dim, self.dim))
+
+        #Number of iterations in a row the iterate has hardly moved
+        self.stable = 0
+
+        #Number of black box evaluations so far
+        self.evaluations = 0
+
+        #Multiplier of the step sizes. None until calibrated
+        self.aScale = 1.0
+        if self.calibration > 0 and not self.secondOrder:
+            self.aScale = None
+        return self.run()
+
+    def resume(self, path=None):
+        """Continue a minimize run from its last checkpoint
+
+        Args:
+            path:
+                Checkpoint file. Defaults to self.checkpointPath
+        Returns:
+            As minimize
+        """
+        self.setState(loadCheckpoint(path or self.checkpointPath))
+        return self.run()
+
+    def state(self):
+        """Return the state of the run, as written to checkpoints"""
+        return {"iterations": self.iterations,
+                "r": self.r.copy(),
+                "rng": self.rng.bit_generator.state,
+                "hessian": self.hessian.copy(),
+                "stable": self.stable,
+                "evaluations": self.evaluations,
+                "aScale": self.aScale,
+                "survey": surveyRandomState(getattr(self.bb, "surv", None))}
+
+    def setState(self, state):
+        """Restore the run to a state returned by self.state"""
+        if len(state["r"]) != self.dim:
+            raise ValueError("Checkpoint is for a different number of "
+                             + "parameters")
+        self.iterations = state["iterations"]
+        self.r = np.array(state["r"], dtype=float)
+        self.rng.bit_generator.state = state["rng"]
+        self.hessian = np.array(state["hessian"], dtype=float)
+        self.stable = state["stable"]
+        self.evaluations = state["evaluations"]
+        self.aScale = state["aScale"]
+        setSurveyRandomState(getattr(self.bb, "surv", None), state["survey"])
+
+    def estimate(self, r, delta, count, secondOrder, pool=None):
+        """Return gradient (and Hessian) estimates at r
+
+        Args:
+            r:
+                Scaled vector to estimate at
+            delta:
+                Size of the perturbations
+            count:
+                Number of independent perturbations
+            secondOrder:
+                bool. If True, also estimate the Hessian
+            pool:
+                As for evaluatePoints
+
+        Returns:
+            gradients:
+                count x dim array. One gradient estimate per
+                    perturbation
+            hessians:
+                count x dim x dim array, or None if not secondOrder
+        """
+        #All points of a perturbation share a simulation seed
+        berns = []
+        seconds = []
+        points = []
+        for _ in range(count):
             bern = self.bernoulli(self.dim)
-            a = self.a(i)
-            delta = self.delta(i)
-            self.fixScaledVec(r)
             rplus = r + delta*bern
             self.fixScaledVec(rplus)
             rminus = r - delta*bern
             self.fixScaledVec(rminus)
-            
-            Yplus = self.bb.returnValue(rplus)
-            Yminus = self.bb.returnValue(rminus)
+            seed = None
+            if self.commonRandomNumbers:
+                seed = int(self.rng.integers(2**63))
+            berns.append(bern)
+            points += [(rplus, seed), (rminus, seed)]
+            if secondOrder:
+                second = self.bernoulli(self.dim)
+                shiftedPlus = r + delta*bern + delta*second
+                self.fixScaledVec(shiftedPlus)
+                shiftedMinus = r - delta*bern + delta*second
+                self.fixScaledVec(shiftedMinus)
+                seconds.append(second)
+                points += [(shiftedPlus, seed), (shiftedMinus, seed)]
+        Y = self.evaluatePoints(points, pool)
+        self.evaluations += len(points)
+
+        width = 4 if secondOrder else 2
+        gradients = np.array([(Y[width*k] - Y[width*k+1])/(2*delta*bern)
+                              for k, bern in enumerate(berns)])
+        if not secondOrder:
+            return gradients, None
+
+        #One-sided gradients at r+delta*bern and r-delta*bern, from the
+        #   second perturbation. Their difference over the first
+        #   perturbation estimates the Hessian (Spall 2000)
+        hessians = []
+        for k, (bern, second) in enumerate(zip(berns, seconds)):
+            yPlus, yMinus, yShiftedPlus, yShiftedMinus = Y[4*k:4*k+4]
+            change = ((yShiftedPlus - yPlus) - (yShiftedMinus - yMinus)
+                      )/(delta*second)
+            estimate = np.outer(change, 1/(2*delta*bern))
+            hessians.append((estimate + estimate.T)/2)
+        return gradients, np.array(hessians)
+
+    def inverseHessian(self):
+        """Return the inverse of the mean Hessian, made positive definite"""
+        values, vectors = np.linalg.eigh(self.hessian)
+        values = np.abs(values)
+        values = np.maximum(values, max(self.hessianFloor*values.max(),
+                                        1e-12))
+        return (vectors/values) @ vectors.T
+
+    def calibrateGain(self, r, pool=None):
+        """Return the step size multiplier for a first step of initialStep"""
+        gradients, _ = self.estimate(r, self.delta(0), self.calibration,
+                                     False, pool)
+        size = np.abs(gradients).max(axis=1).mean()
+        if size == 0:
+            return 1.0
+        return self.initialStep/(self.a(0)*size)
+
+    def converged(self):
+        """Return True if the stopping rule says the run is done"""
+        return self.tolerance is not None and self.stable >= self.patience
+
+    def run(self):
+        """Run the iterations from self.iterations up to Q, or until converged"""
+        r = self.r
+        pool = None
+        if self.workers is not None and self.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=self.workers,
+                                       initializer=_initWorker,
+                                       initargs=(pickle.dumps(self.bb),))
+        try:
+            if self.aScale is None:
+                self.aScale = self.calibrateGain(r, pool)
+            for i in range(self.iterations, self.Q):
+                if self.converged():
+                    break
+                a = self.aScale*self.a(i)
+                delta = self.delta(i)
+                self.fixScaledVec(r)
+
+                gradients, hessians = self.estimate(r, delta,
+                                                    self.perturbations,
+                                                    self.secondOrder, pool)
+                step = a*gradients.mean(axis=0)
+                if self.secondOrder:
+                    self.hessian = (i*self.hessian + hessians.mean(axis=0)
+                                    )/(i + 1)
+                    step = self.inverseHessian() @ step
+                if self.maxStep is not None:
+                    largest = np.abs(step).max()
+                    if largest > self.maxStep:
+                        step *= self.maxStep/largest
+
+                previous = r.copy()
+                r -= step
+                self.fixScaledVec(r)
+                if (self.tolerance is not None
+                        and np.abs(r - previous).max() <= self.tolerance):
+                    self.stable += 1
+                else:
+                    self.stable = 0
 
-            for k in range(len(r)):
-                r[k] -= a*(Yplus-Yminus)/(2*delta*bern[k])
-            self.fixScaledVec(r)
+                self.iterations = i + 1
+                if (self.checkpointPath is not None
+                        and (self.iterations % self.checkpointEvery == 0
+                             or self.iterations == self.Q
+                             or self.converged())):
+                    saveCheckpoint(self.checkpointPath, self.state())
+        finally:
+            if pool is not None:
+                pool.shutdown()
         return r, self.bb.scaledVecToRawVec(r)
             
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Plackett-Burman screening of the parameters of a TransientBlackBox
+
+Before a long optimization, the black box is evaluated on the rows of
+a Plackett-Burman design: a few more runs than there are parameters,
+each parameter at the low or high end of its range. The main effect of
+every parameter (the mean loss at its high end minus the mean loss at
+its low end) shows which parameters matter. The others are frozen at
+the midpoint of their range, and the optimizer only searches the rest,
+through a ReducedBlackBox.
+"""
+
+import numpy as np
+from .fixedPlackettBurman import pbdesign
+
+class ReducedBlackBox:
+    """A black box over some of the parameters of another black box
+
+    The parameters that are not active are held at 0, the midpoint of
+    their range in the scaled [-1,1]^N space. Can be handed to
+    TransientSPSA or TransientSurrogate in place of the black box.
+
+    Args:
+        blackBox:
+            TransientBlackBox, or any class with a rawChar list and a
+                returnValue method
+        active:
+            Indexes of the parameters of blackBox that are searched
+    """
+    def __init__(self, blackBox, active):
+        self.bb = blackBox
+        self.active = np.asarray(active, dtype=np.int64)
+        self.fullDim = len(blackBox.rawChar)
+        self.rawChar = [blackBox.rawChar[i] for i in self.active.tolist()]
+
+        #For the checkpoints of the optimizers
+        self.surv = getattr(blackBox, "surv", None)
+
+    def fullVec(self, scaledVec):
+        """Return the full scaled vector or matrix of the wrapped black box"""
+        scaledVec = np.asarray(scaledVec, dtype=float)
+        full = np.zeros(scaledVec.shape[:-1] + (self.fullDim,))
+        full[..., self.active] = scaledVec
+        return full
+
+    def returnValue(self, scaledVec, seed=None):
+        """Return the loss of the wrapped black box, see TransientBlackBox"""
+        if seed is None:
+            return self.bb.returnValue(self.fullVec(scaledVec))
+        return self.bb.returnValue(self.fullVec(scaledVec), seed=seed)
+
+    def returnValues(self, matrix, seeds=None, backend=None):
+        """Return the loss at every row of matrix, see TransientBlackBox"""
+        matrix = self.fullVec(np.atleast_2d(matrix))
+        if hasattr(self.bb, "returnValues"):
+            if backend is None:
+                return self.bb.returnValues(matrix, seeds)
+            return self.bb.returnValues(matrix, seeds, backend)
+        if seeds is None:
+            seeds = [None]*len(matrix)
+        return np.array([self.bb.returnValue(row, seed=seed)
+                         if seed is not None else self.bb.returnValue(row)
+                         for row, seed in zip(matrix, seeds)], dtype=float)
+
+    def scaledVecToRawVec(self, scaledVec):
+        """Return the full raw vector of the wrapped black box"""
+        return self.bb.scaledVecToRawVec(self.fullVec(scaledVec))
+
+class TransientScreening:
+    def __init__(self, blackBox, threshold=0.1, maxActive=None,
+                 foldover=False, level=1.0, seed=None,
+                 commonRandomNumbers=True):
+        """
+        Args:
+            blackBox:
+                A TransientBlackBox object. Can be replaced with any
+                class that has a rawChar list and a returnValue method
+                that returns float (and takes a seed keyword if
+                commonRandomNumbers is True)
+            threshold:
+                Parameters whose main effect is smaller than threshold
+                    times the largest main effect are frozen
+            maxActive:
+                If given, at most this many parameters (those with the
+                    largest effects) are left active
+            foldover:
+                bool. If True, the design is run a second time with
+                    every sign flipped. This doubles the number of runs,
+                    but keeps interactions between pairs of parameters
+                    out of the main effects
+            level:
+                Scaled distance of the design points from the midpoint.
+                    1 puts them at the ends of the ranges
+            seed:
+                Seed for the simulation seed. None seeds from the OS
+            commonRandomNumbers:
+                bool. If True, every row of the design is run with the
+                    same simulation seed, so that the effects come from
+                    the parameters and not from the noise
+        """
+        self.bb = blackBox
+        self.dim = len(blackBox.rawChar)
+        self.threshold = threshold
+        self.maxActive = maxActive
+        self.foldover = foldover
+        self.level = level
+        self.rng = np.random.default_rng(seed)
+        self.commonRandomNumbers = commonRandomNumbers
+
+        self.design = None
+        self.losses = None
+        self.effects = None
+        self.active = None
+
+    def buildDesign(self):
+        """Return the design: one row of +-1 per run, one column per parameter"""
+        design = np.asarray(pbdesign(self.dim), dtype=float)
+        if self.foldover:
+            design = np.concatenate([design, -design])
+        return design
+
+    def evaluate(self, matrix):
+        """Return the loss of the black box at every row of matrix"""
+        seed = None
+        if self.commonRandomNumbers:
+            seed = int(self.rng.integers(2**63))
+        if hasattr(self.bb, "returnValues"):
+            return np.asarray(self.bb.returnValues(matrix,
+                                                   [seed]*len(matrix)),
+                              dtype=float)
+        if seed is None:
+            return np.array([self.bb.returnValue(vec) for vec in matrix])
+        return np.array([self.bb.returnValue(vec, seed=seed)
+                         for vec in matrix])
+
+    def screen(self):
+        """Run the design, estimate the main effects and pick the active set
+
+        Returns:
+            Integer array of the indexes of the active parameters
+        """
+        self.design = self.buildDesign()
+        self.losses = self.evaluate(self.level*self.design)
+
+        #Every column of the design is +1 in half of the rows and -1 in
+        #   the other half
+        self.effects = self.design.T @ self.losses/(len(self.design)/2)
+
+        size = np.abs(self.effects)
+        active = np.flatnonzero((size >= self.threshold*size.max())
+                                & (size > 0))
+        if self.maxActive is not None and len(active) > self.maxActive:
+            order = np.argsort(-size[active], kind="stable")
+            active = np.sort(active[order[:self.maxActive]])
+        self.active = active
+        return self.active
+
+    def reducedBlackBox(self):
+        """Return a ReducedBlackBox over the active parameters
+
+        Runs the screen first if it has not been run
+        """
+        if self.active is None:
+            self.screen()
+        return ReducedBlackBox(self.bb, self.active)
+
+    def freezeCharPaths(self, profile):
+        """Freeze the insensitive observing profile args for TransientGenetic
+
+        TransientGenetic searches the ranges in the profile's CharPaths
+        rather than the black box's vector. Every frozen profile arg
+        has its CharPath range narrowed to the midpoint of its CharBias
+        range, so the genetic algorithm leaves it there.
+
+        Needs a TransientBlackBox, whose layout says where the profile
+        args sit in the vector.
+
+        Args:
+            profile:
+                The ObservingProfile of the survey the genetic
+                    algorithm will run on. Changed in place
+        """
+        if self.active is None:
+            self.screen()
+        frozen = np.ones(self.dim, dtype=bool)
+        frozen[self.active] = False
+
+        names = ("vCharPath", "oCharPath", "hCharPath", "sCharPath")
+        for name, part in zip(names, self.bb.layout):
+            paths = list(getattr(profile, name))
+            if len(paths) != part.stop - part.start:
+                raise ValueError(name + " and its CharBias have different "
+                                 + "lengths")
+            for k, cG in enumerate(paths):
+                if frozen[part.start + k]:
+                    low, high = self.bb.rawChar[part.start + k][:2]
+                    mid = (low + high)/2
+                    if cG[2].lower().strip() == "int":
+                        paths[k] = (int(round(mid)), int(round(mid)) + 1,
+                                    cG[2])
+                    else:
+                        paths[k] = (mid, mid, cG[2])
+            setattr(profile, name, paths)
@@ -0,0 +1,222 @@
+"""
+Surrogate-model assisted optimization for bias analysis
+
+Every evaluation of a TransientBlackBox runs a whole survey, so the
+optimizer here spends its evaluations carefully: a Gaussian process
+is fit to every loss seen so far, and the next points to run are the
+ones with the highest expected improvement over the best loss. Points
+are proposed in batches, which TransientBlackBox.returnValues can
+evaluate in parallel.
+
+Works in the same scaled [-1,1]^N space as TransientSPSA.
+"""
+import numpy as np
+import math
+
+_erf = np.vectorize(math.erf)
+
+def normalCdf(z):
+    return 0.5*(1 + _erf(z/np.sqrt(2)))
+
+def normalPdf(z):
+    return np.exp(-z**2/2)/np.sqrt(2*np.pi)
+
+class GaussianProcess:
+    """Gaussian process regression with a Matern 5/2 kernel
+
+    The lengthscale and the noise level are chosen from a grid by
+    maximizing the marginal likelihood of the data.
+
+    Args:
+        X:
+            n x dim array of positions
+        y:
+            Length n array of values at X
+        lengthscale, noise:
+            Fixed hyperparameters. Fit to the data if None
+    """
+    LENGTHSCALES = np.geomspace(0.05, 4, 14)
+    NOISES = (1e-8, 1e-6, 1e-4, 1e-2, 1e-1)
+
+    def __init__(self, X, y, lengthscale=None, noise=None):
+        self.X = np.atleast_2d(np.asarray(X, dtype=float))
+        y = np.asarray(y, dtype=float)
+        self.yMean = y.mean()
+        self.yScale = y.std() if y.std() > 0 else 1.0
+        self.y = (y - self.yMean)/self.yScale
+
+        if lengthscale is None or noise is None:
+            lengthscale, noise = max(
+                ((l, n) for l in self.LENGTHSCALES for n in self.NOISES),
+                key=lambda hyper: self.logLikelihood(*hyper))
+        self.lengthscale = lengthscale
+        self.noise = noise
+        self.chol, self.alpha = self.factor(lengthscale, noise)
+
+    def kernel(self, A, B, lengthscale):
+        dist = np.sqrt(np.maximum(
+                    ((A[:, None, :] - B[None, :, :])**2).sum(axis=2), 0))
+        r = np.sqrt(5)*dist/lengthscale
+        return (1 + r + r**2/3)*np.exp(-r)
+
+    def factor(self, lengthscale, noise):
+        """Return the Cholesky factor of K and K^-1 y"""
+        K = self.kernel(self.X, self.X, lengthscale)
+        K[np.diag_indices_from(K)] += noise + 1e-10
+        chol = np.linalg.cholesky(K)
+        alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, self.y))
+        return chol, alpha
+
+    def logLikelihood(self, lengthscale, noise):
+        try:
+            chol, alpha = self.factor(lengthscale, noise)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        return (-self.y @ alpha/2 - np.log(np.diag(chol)).sum())
+
+    def predict(self, Xstar):
+        """Return the posterior mean and standard deviation at Xstar"""
+        Xstar = np.atleast_2d(Xstar)
+        Kstar = self.kernel(Xstar, self.X, self.lengthscale)
+        mean = Kstar @ self.alpha
+        v = np.linalg.solve(self.chol, Kstar.T)
+        var = np.maximum(1 - (v**2).sum(axis=0), 1e-12)
+        return (mean*self.yScale + self.yMean, np.sqrt(var)*self.yScale)
+
+class TransientSurrogate:
+
+    def __init__(self, blackBox, Q, startingVec=None, batchSize=4,
+                 initialPoints=None, seed=None, commonRandomNumbers=True,
+                 candidates=2000, xi=0):
+        """
+        Args:
+            blackBox:
+                A TransientBlackBox object. Can be replaced with any
+                class that has a returnValue method that returns float
+                (and takes a seed keyword if commonRandomNumbers is True)
+            Q:
+                Number of batches to propose after the initial design
+            startingVec:
+                Optional scaled vector to include in the initial design
+            batchSize:
+                Number of points proposed, and evaluated together, per
+                    batch
+            initialPoints:
+                Number of points in the initial Latin hypercube design.
+                    Defaults to 2*dim + 1
+            seed:
+                Seed for the design, the candidates and the simulation
+                    seed. None seeds from the OS
+            commonRandomNumbers:
+                bool. If True, every evaluation runs with the same
+                    simulation seed, so the surrogate models a smooth
+                    loss rather than one blurred by simulation noise.
+                    With TransientBlackBox this also lets evaluations
+                    that only move profile args reuse the truth
+            candidates:
+                Number of random candidate points searched for the
+                    highest expected improvement
+            xi:
+                Exploration margin of the expected improvement, as a
+                    fraction of the spread of the losses seen so far
+        """
+        self.bb = blackBox
+        self.Q = Q
+        self.dim = len(blackBox.rawChar)
+        self.startingVec = startingVec
+        self.batchSize = batchSize
+        self.initialPoints = initialPoints
+        if self.initialPoints is None:
+            self.initialPoints = 2*self.dim + 1
+        self.rng = np.random.default_rng(seed)
+        self.simulationSeed = None
+        if commonRandomNumbers:
+            self.simulationSeed = int(self.rng.integers(2**63))
+        self.candidates = candidates
+        self.xi = xi
+        self.X = np.zeros((0, self.dim))
+        self.Y = np.zeros(0)
+
+    def latinHypercube(self, n):
+        """Return n points of a Latin hypercube design in [-1,1]^dim"""
+        strata = np.array([self.rng.permutation(n) for _ in range(self.dim)]).T
+        return 2*(strata + self.rng.random((n, self.dim)))/n - 1
+
+    def evaluate(self, matrix):
+        """Evaluate the black box at every row and record the results"""
+        seeds = [self.simulationSeed]*len(matrix)
+        if hasattr(self.bb, "returnValues"):
+            Y = self.bb.returnValues(matrix, seeds)
+        elif self.simulationSeed is None:
+            Y = [self.bb.returnValue(vec) for vec in matrix]
+        else:
+            Y = [self.bb.returnValue(vec, seed=self.simulationSeed)
+                 for vec in matrix]
+        self.X = np.vstack([self.X, matrix])
+        self.Y = np.concatenate([self.Y, np.asarray(Y, dtype=float)])
+
+    def expectedImprovement(self, gp, points, best):
+        mean, std = gp.predict(points)
+        improvement = best - mean - self.xi*gp.yScale
+        z = improvement/std
+        return improvement*normalCdf(z) + std*normalPdf(z)
+
+    def proposeBatch(self):
+        """Return batchSize new points with high expected improvement
+
+        After each pick, the surrogate is told the point's predicted
+        loss as if it had been evaluated (the "kriging believer"),
+        which steers the next picks of the batch elsewhere
+        """
+        gp = GaussianProcess(self.X, self.Y)
+        X = self.X
+        Y = self.Y
+        best = Y.min()
+
+        #Random candidates, plus candidates close to the best points.
+        #   The local ones are spread on several scales, so the search
+        #   keeps refining once the best points are close together
+        incumbents = X[np.argsort(Y)[:5]]
+        nLocal = self.candidates//2
+        scales = gp.lengthscale*np.geomspace(1/4, 1/256, 5)
+        local = (incumbents[self.rng.integers(0, len(incumbents), nLocal)]
+                 + self.rng.normal(0, 1, (nLocal, self.dim))
+                   *self.rng.choice(scales, nLocal)[:, None])
+        points = np.vstack([self.rng.uniform(-1, 1, (self.candidates//2,
+                                                     self.dim)),
+                            np.clip(local, -1, 1)])
+
+        batch = []
+        for _ in range(self.batchSize):
+            ei = self.expectedImprovement(gp, points, best)
+            if ei.max() > 0:
+                pick = points[np.argmax(ei)]
+            else:
+                #No candidate is expected to improve on best by xi (or
+                #   the improvement underflows). Take the lowest
+                #   confidence bound instead
+                mean, std = gp.predict(points)
+                pick = points[np.argmin(mean - 2*std)]
+            batch.append(pick)
+            believed = gp.predict(pick)[0]
+            X = np.vstack([X, pick])
+            Y = np.concatenate([Y, believed])
+            best = min(best, believed[0])
+            gp = GaussianProcess(X, Y, gp.lengthscale, gp.noise)
+        return np.array(batch)
+
+    def bestVec(self):
+        """Return the evaluated point with the lowest predicted loss"""
+        gp = GaussianProcess(self.X, self.Y)
+        return self.X[np.argmin(gp.predict(self.X)[0])]
+
+    def minimize(self):
+        """Return minimized scaled and raw parameters"""
+        design = self.latinHypercube(self.initialPoints)
+        if self.startingVec is not None:
+            design[0] = self.startingVec
+        self.evaluate(design)
+        for _ in range(self.Q):
+            self.evaluate(self.proposeBatch())
+        r = self.bestVec()
+        return r, self.bb.scaledVecToRawVec(r)